@@ -1,29 +1,13 @@
 import os
-import re
-import shutil
+import json
 import functools
-import traceback
 from pathlib import Path
-from urllib.parse import urlparse
-from contextlib import contextmanager
 
 import click
-from flask import url_for
 
 from .__meta__ import __version__
-from . import app, load_posts, raw_folder, root_folder, pages_folder, posts_folder, static_folder, theme_static_folder
-
-echo = click.echo
-echo_green = functools.partial(click.secho, fg="green")
-echo_red = functools.partial(click.secho, fg="red")
-echo_yellow = functools.partial(click.secho, fg="yellow")
-
-
-@contextmanager
-def step(op_name: str):
-    echo(f"{op_name}...", nl=False)
-    yield
-    echo_green("OK")
+from .console import echo, step, echo_red, echo_green, echo_yellow
+from . import raw_folder, root_folder, cache_folder, pages_folder, posts_folder, static_folder
 
 
 @click.group(name="purepress", short_help="A simple static blog generator.")
@@ -78,173 +62,115 @@ def init_command():
 @click.option("--host", "-h", default="127.0.0.1", help="Host to preview the site.")
 @click.option("--port", "-p", default=8080, help="Port to preview the site.")
 @click.option("--no-debug", is_flag=True, default=False, help="Do not preview in debug mode.")
-def preview_command(host, port, no_debug):
+@click.option("--no-watch", is_flag=True, default=False, help="Do not watch for changes and reload pages.")
+def preview_command(host, port, no_debug, no_watch):
+    from . import app, preload_templates
+
     app.config["ENV"] = "development"
     app.config["TEMPLATES_AUTO_RELOAD"] = True
-    app.run(host=host, port=port, debug=not no_debug, use_reloader=False)
+    if not no_watch:
+        from .preview import enable_live_reload, default_watch_paths
 
+        watcher = enable_live_reload(default_watch_paths())
+        echo(f"Watching for changes ({watcher.backend})")
+    preload_templates()
+    app.run(host=host, port=port, debug=not no_debug, use_reloader=False, threaded=True)
 
-@cli.command("build", short_help="Build the site.")
+
+@cli.command("serve", short_help="Serve the site in production mode.")
+@click.option("--host", "-h", default="127.0.0.1", help="Host to serve the site.")
+@click.option("--port", "-p", default=8080, help="Port to serve the site.")
 @click.option(
-    "--url-root",
-    prompt="Please enter the url root (used as prefix of generated url)",
-    help='The url root of your site, e.g. "http://example.com/blog/".',
+    "--workers",
+    "-w",
+    default=0,
+    type=click.IntRange(min=0),
+    help="Number of worker processes (requires gunicorn), 0 means the number of CPUs.",
 )
-def build_command(url_root):
-    res = urlparse(url_root)
-    app_root = res.path or "/"
-    app.config["PREFERRED_URL_SCHEME"] = res.scheme or "http"
-    app.config["SERVER_NAME"] = res.netloc or "localhost"
-    if not res.netloc:
-        echo_yellow('The url root does not contain a valid server name, "localhost" will be used.')
-    app.config["APPLICATION_ROOT"] = app_root
-    # mark as 'BUILDING' status, so that templates can react properly,
-    app.config["BUILDING"] = True
+@click.option("--threads", default=8, type=click.IntRange(min=1), help="Number of threads of each worker.")
+@click.option("--no-watch", is_flag=True, default=False, help="Do not watch for changes of the sources.")
+def serve_command(host, port, workers, threads, no_watch):
+    from .serve import run_server
+    from .preview import default_watch_paths
 
+    workers = workers or os.cpu_count() or 1
     try:
-        with app.test_client() as client:
-            build(lambda url: client.get(re.sub(r"^" + app_root, "/", url)))
-        echo_green('OK! Now you can find the built site in the "build" folder.')
-    except Exception:
-        traceback.print_exc()
-        echo_red("Failed to build the site.")
-        exit(1)
+        import gunicorn  # noqa: F401
+    except ImportError:
+        if workers > 1:
+            echo_yellow("gunicorn is not installed, serving with threads of a single process.")
+        workers = 1
+    run_server(host, port, workers=workers, threads=threads, watch_paths=[] if no_watch else default_watch_paths())
+
+
+@cli.command("bench", short_help="Benchmark on synthetic instances.")
+@click.option(
+    "--sizes",
+    default="100,1000,10000,50000",
+    help="Comma separated numbers of posts of the generated instances.",
+)
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="Write the JSON results to this file.")
+@click.option("--workdir", type=click.Path(file_okay=False), help="Folder to generate the instances in.")
+@click.option("--repeat", default=5, type=click.IntRange(min=1), help="Times to repeat the hot operations.")
+@click.option("--no-build", is_flag=True, default=False, help="Do not measure the build.")
+def bench_command(sizes, output, workdir, repeat, no_build):
+    from .bench import run_benchmarks
+
+    report = run_benchmarks(
+        [int(size) for size in sizes.split(",") if size.strip()],
+        workdir=Path(workdir) if workdir else cache_folder / "bench",
+        theme_folder=root_folder / "theme",
+        build=not no_build,
+        repeat=repeat,
+        echo=functools.partial(echo, err=True),
+    )
+    result = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(result)
+    else:
+        echo(result)
 
 
-def build(get):
-    # prepare folder paths
-    build_folder = root_folder / "build"
-    build_static_folder = build_folder / "static"
-    build_static_theme_folder = build_static_folder / "theme"
-    build_pages_folder = build_folder
-    build_posts_folder = build_folder / "post"
-    build_categories_folder = build_folder / "category"
-    build_tags_folder = build_folder / "tag"
-    build_archive_folder = build_folder / "archive"
-    build_index_page_folder = build_folder / "page"
-
-    with step("Creating build folder"):
-        if os.path.isdir(build_folder):
-            shutil.rmtree(build_folder)
-        elif os.path.exists(build_folder):
-            os.remove(build_folder)
-        os.mkdir(build_folder)
-
-    with step("Copying raw files"):
-        copy_folder_content(raw_folder, build_folder)
-
-    with step("Copying theme static files"):
-        os.makedirs(build_static_theme_folder, exist_ok=True)
-        copy_folder_content(theme_static_folder, build_static_theme_folder)
-
-    with step("Copying static files"):
-        copy_folder_content(static_folder, build_static_folder)
-
-    with step("Building custom pages"):
-        for dirname, _, files in os.walk(pages_folder):
-            if os.path.basename(dirname).startswith("."):
-                continue
-            rel_dirname = os.path.relpath(dirname, pages_folder)
-            (build_pages_folder / rel_dirname).mkdir(parents=True, exist_ok=True)
-            for file in filter(lambda f: not f.startswith("."), files):
-                rel_path = Path(rel_dirname) / file
-                dst_rel_path = rel_path.with_suffix(".html")
-                dst_path = build_pages_folder / dst_rel_path
-                rel_url = dst_rel_path.as_posix()
-                with app.test_request_context():
-                    url = url_for("page", rel_url=rel_url)
-                res = get(url)
-                with open(dst_path, "wb") as f:
-                    f.write(res.data)
-
-    with app.test_request_context():
-        posts = load_posts(meta_only=True)
-    with step("Building posts"):
-        for post in posts:
-            filename = post["filename"]
-            year, month, day, name = Path(filename).stem.split("-", maxsplit=3)
-            dst_dir = build_posts_folder / year / month / day / name
-            dst_dir.mkdir(parents=True, exist_ok=True)
-            dst_path = dst_dir / "index.html"
-            with app.test_request_context():
-                url = url_for("post", year=year, month=month, day=day, name=name)
-            res = get(url)
-            with open(dst_path, "wb") as f:
-                f.write(res.data)
-
-    with step("Building categories"):
-        categories = set(functools.reduce(lambda c, p: c + p.get("categories", []), posts, []))
-        for category in categories:
-            category_folder = build_categories_folder / category
-            os.makedirs(category_folder, exist_ok=True)
-            with app.test_request_context():
-                url = url_for("category", name=category)
-            res = get(url)
-            with open(category_folder / "index.html", "wb") as f:
-                f.write(res.data)
-
-    with step("Building tags"):
-        tags = set(functools.reduce(lambda t, p: t + p.get("tags", []), posts, []))
-        for tag in tags:
-            tag_folder = build_tags_folder / tag
-            os.makedirs(tag_folder, exist_ok=True)
-            with app.test_request_context():
-                url = url_for("tag", name=tag)
-            res = get(url)
-            with open(tag_folder / "index.html", "wb") as f:
-                f.write(res.data)
-
-    with step("Building archive"):
-        os.makedirs(build_archive_folder, exist_ok=True)
-        with app.test_request_context():
-            url = url_for("archive")
-        res = get(url)
-        with open(build_archive_folder / "index.html", "wb") as f:
-            f.write(res.data)
-
-    with step("Building index"):
-        with app.test_request_context():
-            url = url_for("index")
-        res = get(url)
-        with open(build_folder / "index.html", "wb") as f:
-            f.write(res.data)
-        page_num = 2
-        while True:
-            page_folder = build_index_page_folder / str(page_num)
-            os.makedirs(page_folder, exist_ok=True)
-            with app.test_request_context():
-                url = url_for("index_page", page_num=page_num)
-            res = get(url)
-            if res.status_code != 200:
-                break
-            with open(page_folder / "index.html", "wb") as f:
-                f.write(res.data)
-            page_num += 1
-
-    with step("Building feed"):
-        with app.test_request_context():
-            url = url_for("feed")
-        res = get(url)
-        with open(build_folder / "feed.xml", "wb") as f:
-            f.write(res.data)
-
-    with step("Building 404"):
-        with app.test_request_context():
-            url = url_for("page_not_found")
-        res = get(url)
-        with open(build_folder / "404.html", "wb") as f:
-            f.write(res.data)
-
-
-def copy_folder_content(src: Path, dst: Path):
-    """
-    Copy all content in src directory to dst directory.
-    The src and dst must exist.
-    """
-    if not src.is_dir():
-        return
-    for item in src.iterdir():
-        if item.is_file():
-            shutil.copy2(item, dst / item.name)
-        elif item.is_dir():
-            shutil.copytree(item, dst / item.name)
+@cli.command("build", short_help="Build the site.")
+@click.option(
+    "--url-root",
+    prompt="Please enter the url root (used as prefix of generated url)",
+    help='The url root of your site, e.g. "http://example.com/blog/".',
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Only rebuild outputs affected by changes since the last build.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=0),
+    help="Number of processes to render with, 0 means the number of CPUs.",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    help="Profile the build and write the timings of every page and phase to this file.",
+)
+@click.option(
+    "--profile-format",
+    type=click.Choice(["chrome", "json"]),
+    default="chrome",
+    help="Write the profile as a Chrome trace, or as a JSON report of all pages.",
+)
+@click.option("--profile-top", default=10, type=click.IntRange(min=0), help="Number of slowest pages to show.")
+def build_command(url_root, incremental, jobs, profile, profile_format, profile_top):
+    from .builder import build_site
+
+    build_site(
+        url_root,
+        incremental=incremental,
+        jobs=jobs,
+        profile=profile,
+        profile_format=profile_format,
+        profile_top=profile_top,
+    )
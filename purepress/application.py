@@ -0,0 +1,829 @@
+import os
+import re
+import functools
+from pathlib import Path
+from importlib import metadata
+from urllib.parse import unquote
+from datetime import date, datetime, timezone, timedelta
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import toml
+import yaml
+from werkzeug.security import safe_join
+from flask import (
+    Flask,
+    Response,
+    Blueprint,
+    g,
+    abort,
+    jsonify,
+    request,
+    url_for,
+    redirect,
+    make_response,
+    render_template,
+    stream_template,
+    has_request_context,
+    send_from_directory,
+)
+
+from .profiling import span
+from .links import LinkResolver
+from .__meta__ import __version__
+from .content import Entry, PostIndex, taxonomy_terms
+from .cache import DiskCache, TemplateBytecodeCache, hash_key
+from .feed import FEED_CONTENT_TYPES, FeedCache, generate_feed
+from . import (
+    toc,
+    images,
+    highlight,
+    raw_folder,
+    root_folder,
+    cache_folder,
+    pages_folder,
+    posts_folder,
+    static_folder,
+    template_folder,
+    theme_static_folder,
+    image_derivatives_folder,
+)
+
+# the names forwarded by the package, e.g. `from purepress import app`, see purepress/__init__.py
+__all__ = [
+    "app",
+    "site",
+    "config",
+    "check_links",
+    "post_index",
+    "render_cache",
+    "image_settings",
+    "indexed_posts",
+    "load_post",
+    "load_posts",
+    "indexed_taxonomy",
+    "indexed_archives",
+    "preload_templates",
+    "rendered_links",
+    "resolved_templates",
+    "asset_fingerprints",
+    "archive_page_count",
+]
+
+# load configurations
+try:
+    purepress_config = toml.load(root_folder / "purepress.toml")
+except FileNotFoundError:
+    purepress_config = {"site": {}, "config": {}}
+site, config = purepress_config["site"], purepress_config["config"]
+
+app = Flask(
+    __name__,
+    instance_path=root_folder.as_posix(),
+    template_folder=template_folder,
+    static_folder=static_folder,
+    instance_relative_config=True,
+)
+if config.get("template_bytecode_cache", True):
+    # new processes (build workers, previews) load compiled templates instead of compiling them again
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": TemplateBytecodeCache(cache_folder / "jinja")}
+
+# handle static files for theme
+theme_bp = Blueprint(
+    "theme",
+    __name__,
+    static_url_path="/static/theme",
+    static_folder=theme_static_folder,
+)
+app.register_blueprint(theme_bp)
+
+
+# prepare markdown parser
+def link_target_exists(kind: str, path: str) -> bool:
+    if kind == "posts":
+        # hidden posts are not published, so links to them are broken too
+        # NOTE: the post index is not refreshed here, callers refresh it once for all links
+        post = post_index.find(path)
+        return post is not None and not post.get("hide", False)
+    folder = pages_folder if kind == "pages" else raw_folder
+    fullpath = safe_join(folder.as_posix(), path)
+    if fullpath is None:
+        return False
+    if os.path.isdir(fullpath):
+        fullpath = os.path.join(fullpath, "index.md" if kind == "pages" else "index.html")
+    return os.path.isfile(fullpath)
+
+
+@functools.lru_cache(maxsize=16)
+def _link_resolver(script_root: str) -> LinkResolver:
+    # urls only depend on the script root of requests, given the app config
+    return LinkResolver(url_for("index"), url_for("static", filename=""), link_target_exists)
+
+
+def link_resolver() -> LinkResolver:
+    return _link_resolver(request.script_root)
+
+
+def image_settings() -> Optional[dict[str, Any]]:
+    # resize images in the static folder when converting markdown, if enabled and Pillow is installed
+    if not (images.has_pillow and config.get("responsive_images", False)):
+        return None
+    return {
+        "widths": config.get("image_widths", [480, 960, 1440]),
+        "format": config.get("image_format", "webp"),
+        "quality": config.get("image_quality", 80),
+        "sizes": config.get("image_sizes", "100vw"),
+    }
+
+
+def static_image_info(src: str) -> Optional[images.ImageInfo]:
+    # info of an image linked as /static/<path>, if it can be resized
+    if not src.startswith("/static/"):
+        return None
+    rel_path = unquote(re.split(r"[?#]", src, maxsplit=1)[0][len("/static/") :])
+    fullpath = safe_join(static_folder.as_posix(), rel_path)
+    if fullpath is None:
+        return None
+    return images.image_info(Path(fullpath))
+
+
+def server_highlighting() -> bool:
+    # highlight code blocks with Pygments when converting markdown, if enabled (`highlight_code = true`)
+    # and Pygments is installed (the "highlight" extra), otherwise themes highlight them in the browser
+    return highlight.has_pygments and config.get("highlight_code", False)
+
+
+def _markdown_convert(text: str, *, parse_toc: bool = False) -> dict[str, Any]:
+    # the markdown pipeline is imported on the first conversion, it takes a while to import
+    from .markdown_ext import convert
+
+    return convert(text, parse_toc=parse_toc)
+
+
+def _package_version(name: str) -> Optional[str]:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+# identifies the markdown pipeline, change it whenever the generated html may change,
+# the versions of purepress and of the libraries making the html are part of it
+_md_signature = [
+    "purepress",
+    __version__,
+    *(f"{name}=={_package_version(name)}" for name in ("markdown", "py-gfm", "pygments")),
+    "gfm",
+    "hook-image-src",
+    "hook-link-href",
+    "footnotes",
+    "links-v2",
+    "highlight-code",
+    "responsive-image",
+    "heading-anchor",
+]
+
+
+def markdown_convert(text: str) -> str:
+    return _markdown_convert(text)["content"]
+
+
+# links to source files in the entries rendered while building, as {source file: links},
+# checked once all pages are built, see `check_links`
+rendered_links: dict[str, set[str]] = {}
+
+
+# rendered html and headings of entries, keyed by their markdown source
+render_cache = DiskCache(
+    cache_folder / "render",
+    max_size=config.get("render_cache_max_size", 64 * 1024 * 1024),
+)
+
+
+def render_content(text: str, *, parse_toc: bool, toc_depth: int, source: str = "") -> dict[str, Any]:
+    rendered = _render_content(text, parse_toc=parse_toc, toc_depth=toc_depth)
+    # links to source files are recorded every time, targets may come and go
+    rendered = dict(rendered)
+    rendered.pop("images", None)
+    links = rendered.pop("source_links", [])
+    if source and app.config.get("BUILDING"):
+        # even if there are none, they replace the links of the previous build
+        rendered_links.setdefault(Path(source).as_posix(), set()).update(links)
+    return rendered
+
+
+def check_links(links: dict[str, list[str]]) -> list[tuple[str, str]]:
+    """The broken ones of the links in the given sources, as (source file, link) pairs."""
+    post_index.refresh(scope=url_for("index"))
+    resolver = link_resolver()
+    return [
+        (source, link) for source, source_links in links.items() for link in source_links if resolver.is_broken(link)
+    ]
+
+
+def _render_content(text: str, *, parse_toc: bool, toc_depth: int) -> dict[str, Any]:
+    # one conversion serves both the pages showing the toc and the listings and feeds
+    rendered = dict(_convert_content(text))
+    headings = rendered.pop("headings", [])
+    if parse_toc:
+        # headings got their anchors when converting, only the toc is left to make
+        with span("toc"):
+            rendered["toc"] = toc.make_toc(headings, toc_depth)
+            rendered["toc_html"] = toc.toc_html(rendered["toc"])
+    elif headings:
+        rendered["content"] = toc.strip_anchors(rendered["content"], headings)
+    return rendered
+
+
+def _convert_content(text: str) -> dict[str, Any]:
+    key = None
+    if config.get("render_cache_enabled", True):
+        # the generated links depend on the url root
+        url_root = url_for("index"), url_for("static", filename="")
+        key = hash_key(_md_signature, server_highlighting(), image_settings(), text, url_root)
+        rendered = render_cache.get(key)
+        # the html has the size and derivatives of images, which may change without the markdown
+        if rendered is not None and all(
+            getattr(static_image_info(src), "digest", None) == digest for src, digest in rendered.get("images", [])
+        ):
+            return rendered
+    converted = _markdown_convert(text, parse_toc=True)
+    rendered: dict[str, Any] = {"content": converted["content"]}
+    for field in ("source_links", "images", "headings"):
+        if converted[field]:
+            rendered[field] = converted[field]
+    if key is not None:
+        render_cache.set(key, rendered)
+    return rendered
+
+
+@app.route("/static/_images/<filename>")
+def image_derivative(filename: str):
+    # built by the build (or an earlier request), and resized on demand when previewing or serving
+    derivative = images.parse_derivative_name(filename)
+    if derivative is None:
+        abort(404)
+    path = image_derivatives_folder / filename
+    if not path.is_file():
+        digest, width, fmt = derivative
+        source = images.find_source(digest, static_folder)
+        if source is None:
+            abort(404)
+        images.make_derivative(source, path, width, fmt, quality=config.get("image_quality", 80))
+    return send_from_directory(image_derivatives_folder, filename, max_age=365 * 24 * 3600)
+
+
+# fingerprinted names of static files, as {(endpoint, filename): fingerprinted filename},
+# filled by the build so that templates link to files that can be cached forever
+asset_fingerprints: dict[tuple[str, str], str] = {}
+
+
+@app.url_defaults
+def fingerprint_static_url(endpoint: str, values: dict[str, Any]):
+    if asset_fingerprints and endpoint in ("static", "theme.static"):
+        filename = values.get("filename")
+        values["filename"] = asset_fingerprints.get((endpoint, filename), filename)
+
+
+# inject site and config into template context
+@app.context_processor
+def inject_objects() -> dict[str, Any]:
+    objects = {"site": site, "config": config, "server_highlight": server_highlighting()}
+    if config.get("taxonomy_terms"):
+        # e.g. global.terms("tags") for a tag cloud, only made if a template calls it
+        objects["terms"] = indexed_terms
+    return {"global": objects}
+
+
+# use the C-accelerated yaml loader if libyaml is available
+_yaml_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def load_frontmatter(frontmatter: str) -> dict[str, Any]:
+    with span("yaml"):
+        try:
+            return yaml.load(frontmatter, Loader=_yaml_loader) or {}
+        except yaml.constructor.ConstructorError:
+            # tags beyond the safe subset were once allowed, keep them working
+            return yaml.load(frontmatter, Loader=yaml.FullLoader) or {}
+
+
+def scan_frontmatter(f) -> tuple[str, str]:
+    """
+    Read the frontmatter from a file positioned right after the opening "---",
+    stopping at the closing "---" so that the body is never read.
+    Returns the frontmatter and the rest of the line after the closing "---".
+    """
+    lines = []
+    for line in f:
+        i = line.find("---")
+        if i >= 0:
+            lines.append(line[:i])
+            return "".join(lines), line[i + 3 :]
+        lines.append(line)
+    return "".join(lines), ""
+
+
+def read_entry(fullpath: str, *, meta_only: bool) -> Optional[tuple[str, str]]:
+    # read frontmatter and content, the content is not read at all if meta_only
+    frontmatter, content = "", ""
+    try:
+        with open(fullpath, encoding="utf-8") as f:
+            firstline = f.readline().strip()
+            if firstline == "---":
+                frontmatter, remained = scan_frontmatter(f)
+                if not meta_only:
+                    content = (remained + f.read()).strip()
+            elif not meta_only:
+                content = "\n\n".join([firstline, f.read().strip()])
+    except FileNotFoundError:
+        return None
+    return frontmatter, content
+
+
+def load_entry(fullpath: str, *, meta_only: bool, parse_toc: bool) -> Optional[Entry]:
+    res = read_entry(fullpath, meta_only=meta_only)
+    if res is None:
+        return None
+    if not meta_only and app.config.get("SERVING"):
+        mark_sources_modified([os.stat(fullpath).st_mtime_ns])
+    frontmatter, content = res
+    # construct the entry object
+    entry = Entry(load_frontmatter(frontmatter))
+    # ensure datetime fields are real datetime
+    for k in ("created", "updated"):
+        if isinstance(entry.get(k), date) and not isinstance(entry.get(k), datetime):
+            entry[k] = datetime.combine(entry[k], datetime.min.time())
+    # ensure tags and categories are lists
+    for k in ("categories", "tags"):
+        if isinstance(entry.get(k), str):
+            entry[k] = [entry[k]]
+    # if should, convert markdown content to html
+    if not meta_only:
+        depth = entry.get("toc_depth", config.get("toc_depth")) or 0
+        source = os.path.relpath(fullpath, root_folder)
+        entry.update(render_content(content, parse_toc=parse_toc, toc_depth=depth, source=source))
+    return entry
+
+
+def load_post(filename: str, *, meta_only: bool = False, parse_toc: bool = False) -> Optional[Entry]:
+    # parse the filename (yyyy-MM-dd-post-title.md)
+    try:
+        year, month, day, name = os.path.splitext(filename)[0].split("-", maxsplit=3)
+        year, month, day = int(year), int(month), int(day)
+    except ValueError:
+        return None
+    # load post entry
+    fullpath = safe_join(posts_folder.as_posix(), filename)
+    if fullpath is None:
+        return None
+    post = load_entry(fullpath, meta_only=meta_only, parse_toc=parse_toc)
+    if post is None:  # note that post may be {}
+        return None
+    # add some fields
+    post["filename"] = filename
+    post["url"] = url_for(
+        "post",
+        year=f"{year:0>4d}",
+        month=f"{month:0>2d}",
+        day=f"{day:0>2d}",
+        name=name,
+    )
+    # ensure *title* field
+    if "title" not in post:
+        post["title"] = " ".join(name.split("-"))
+    # ensure *created* field
+    if "created" not in post:
+        post["created"] = datetime(year=year, month=month, day=day)
+    return post
+
+
+def make_excerpt(content: str) -> str:
+    """
+    Cut the excerpt out of markdown content, that is all content before the
+    excerpt marker (`<!-- more -->` by default), or the first few paragraphs.
+    """
+    marker = config.get("excerpt_marker", "<!-- more -->")
+    if marker and marker in content:
+        return content.split(marker, maxsplit=1)[0].strip()
+    max_paragraphs = config.get("excerpt_paragraphs", 3)
+    paragraphs, lines, in_fence = 0, [], False
+    for line in content.splitlines():
+        if line.lstrip().startswith(("```", "~~~")):
+            in_fence = not in_fence
+        elif not line.strip() and not in_fence and lines and lines[-1].strip():
+            # a blank line outside code blocks ends a paragraph
+            paragraphs += 1
+            if paragraphs >= max_paragraphs:
+                break
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def lazy_post(meta: Entry) -> Entry:
+    """
+    Make a post entry from indexed metadata, with `content` and `excerpt`
+    converted from markdown only if they are actually used.
+    """
+    fullpath = (posts_folder / meta["filename"]).as_posix()
+    source = os.path.relpath(fullpath, root_folder)
+    toc_depth = meta.get("toc_depth", config.get("toc_depth")) or 0
+
+    def load_content() -> dict[str, Any]:
+        res = read_entry(fullpath, meta_only=False)
+        content = res[1] if res else ""
+        return render_content(content, parse_toc=False, toc_depth=toc_depth, source=source)
+
+    def load_excerpt() -> dict[str, Any]:
+        res = read_entry(fullpath, meta_only=False)
+        excerpt = make_excerpt(res[1]) if res else ""
+        return {"excerpt": render_content(excerpt, parse_toc=False, toc_depth=toc_depth, source=source)["content"]}
+
+    return meta.copy(lazy={"content": load_content, "excerpt": load_excerpt})
+
+
+# parsed post metadata, shared by all requests and reloaded per file on change
+post_index = PostIndex(posts_folder, functools.partial(load_post, meta_only=True))
+
+
+def indexed_posts() -> list[Entry]:
+    # metadata entries depend on the url root, so use it as the index scope
+    # NOTE: the returned list is shared, callers must not modify it
+    return post_index.posts(scope=url_for("index"))
+
+
+def indexed_taxonomy(kind: str) -> dict[str, list[Entry]]:
+    # kind is either "categories" or "tags", the returned dict is shared too
+    if kind == "categories":
+        return post_index.categories(scope=url_for("index"))
+    return post_index.tags(scope=url_for("index"))
+
+
+# terms of each taxonomy with their urls, as {kind: (buckets they are made of, terms)}
+_indexed_terms: dict[str, tuple[dict[str, list[Entry]], list[dict[str, Any]]]] = {}
+
+
+def indexed_terms(kind: str) -> list[dict[str, Any]]:
+    """
+    The categories or tags with their post counts, tag cloud weights and
+    urls, see `content.taxonomy_terms`. Made again only when the index is.
+    """
+    buckets = indexed_taxonomy(kind)
+    cached = _indexed_terms.get(kind)
+    if cached is not None and cached[0] is buckets:
+        return cached[1]
+    endpoint = "category" if kind == "categories" else "tag"
+    terms = [dict(term, url=url_for(endpoint, name=term["name"])) for term in taxonomy_terms(buckets)]
+    _indexed_terms[kind] = (buckets, terms)
+    return terms
+
+
+def indexed_archives() -> dict[tuple[int, ...], list[Entry]]:
+    # posts of each (year,) and (year, month), the returned dict is shared too
+    return post_index.archives(scope=url_for("index"))
+
+
+def archive_page_count(post_count: int) -> int:
+    # archive, category and tag pages are only paginated if posts_per_archive_page is set
+    posts_per_page = config.get("posts_per_archive_page", 0)
+    if not posts_per_page:
+        return 1
+    return max(1, (post_count + posts_per_page - 1) // posts_per_page)
+
+
+def load_posts(*, meta_only: bool = False) -> list[Entry]:
+    posts = indexed_posts()
+    if meta_only:
+        return list(posts)
+    return [p for p in (load_post(p["filename"]) for p in posts) if p]
+
+
+def load_page(rel_url: str, *, parse_toc: bool = False) -> Optional[Entry]:
+    # convert relative url to full file path
+    pathnames = rel_url.split("/")
+    fullpath = safe_join(pages_folder.as_posix(), *pathnames)
+    if fullpath is None:
+        return None
+    if fullpath.endswith(os.path.sep):  # /foo/bar/
+        fullpath = os.path.join(fullpath, "index.md")
+    elif fullpath.endswith(".html"):  # /foo/bar.html
+        fullpath = os.path.splitext(fullpath)[0] + ".md"
+    else:  # /foo/bar
+        fullpath += ".md"
+    # load page entry
+    page = load_entry(fullpath, meta_only=False, parse_toc=parse_toc)
+    if page is None:
+        return None
+    page["url"] = url_for("page", rel_url=rel_url)
+    # ensure *title* field
+    if "title" not in page:
+        name = os.path.splitext(os.path.basename(fullpath))[0]
+        page["title"] = " ".join(name.split("-"))
+    return page
+
+
+# resolved names of templates, as {template: "custom/template" or template}
+resolved_templates: dict[str, str] = {}
+
+
+def resolve_template(template: str) -> str:
+    """
+    The name of the template to render: its override in the custom folder
+    if there is one, the template itself otherwise. Resolved only once when
+    templates are not reloaded automatically.
+    """
+    name = resolved_templates.get(template)
+    if name is None:
+        name = app.jinja_env.select_template([f"custom/{template}", template]).name or template
+        if not app.jinja_env.auto_reload:
+            resolved_templates[template] = name
+    return name
+
+
+def preload_templates():
+    """Compile (or load from the bytecode cache) all templates and resolve them ahead of the first request."""
+    for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith(".j2")):
+        if not name.startswith("custom/"):
+            resolve_template(name)
+        app.jinja_env.get_template(name)
+
+
+def mark_sources_modified(mtimes: Iterable[int]):
+    """
+    Note the modification times (in ns) of sources rendered by the current
+    request, the latest one becomes the Last-Modified of the response.
+    Only done when serving, see `serve.enable_serving`.
+    """
+    latest = max(mtimes, default=0)
+    if has_request_context() and latest > g.get("sources_modified", 0):
+        g.sources_modified = latest
+
+
+def posts_mtimes(posts: Iterable[Entry]) -> Iterator[int]:
+    # modification times of indexed posts, as loaded by the index
+    for p in posts:
+        stat = post_index.stat(p["filename"])
+        if stat is not None:
+            yield stat[0]
+
+
+@app.after_request
+def set_last_modified(res: Response) -> Response:
+    modified = g.get("sources_modified")
+    if modified and res.last_modified is None:
+        res.last_modified = datetime.fromtimestamp(modified // 10**9, timezone.utc)
+    return res
+
+
+def templated(template: str) -> Callable:
+    if not template.endswith(".html.j2"):
+        template += ".html.j2"
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            res = func(*args, **kwargs)
+            if isinstance(res, dict):
+                if app.config.get("SERVING") and "entries" in res:
+                    mark_sources_modified(posts_mtimes(res["entries"]))
+                if g.get("stream_templates"):
+                    # the build renders straight into files, no need to hold the whole page
+                    return stream_template(resolve_template(template), **res)
+                with span("jinja"):
+                    return render_template(resolve_template(template), **res)
+            return res
+
+        return wrapper
+
+    return decorator
+
+
+@app.route("/")
+def index():
+    # the logic is the same as /page/1/, just reuse it
+    return index_page(1, from_index=True)
+
+
+@app.route("/page/<int:page_num>/")
+@templated("index")
+def index_page(page_num, *, from_index: bool = False):
+    # do some calculation and handle unexpected cases
+    posts_per_page = config["posts_per_index_page"]
+    posts = indexed_posts()  # just use the indexed meta data
+    post_count = len(posts)
+    page_count = (post_count + posts_per_page - 1) // posts_per_page
+    if page_num == 1 and not from_index:
+        # redirect /page/1/ to /
+        return redirect(url_for("index"), 302)
+    if page_num < 1 or page_num > page_count:
+        abort(404)
+
+    # prepare pager links
+    prev_url, next_url = None, None
+    if page_num == 2:
+        prev_url = url_for("index")
+    elif page_num > 2:
+        prev_url = url_for("index_page", page_num=page_num - 1)
+    if page_num < page_count:
+        next_url = url_for("index_page", page_num=page_num + 1)
+
+    # load posts in the specified range
+    begin = (page_num - 1) * posts_per_page
+    end = min(post_count, begin + posts_per_page)
+    # content is only converted if the template uses it
+    posts_to_render = [lazy_post(posts[i]) for i in range(begin, end)]
+    return {
+        "entries": posts_to_render,
+        "pager": {"prev_url": prev_url, "next_url": next_url},
+    }
+
+
+@app.route("/post/<year>/<month>/<day>/<name>/")
+@templated("post")
+def post(year: str, month: str, day: str, name: str):
+    # use secure_filename to avoid filename attacks
+    post = load_post(f"{year}-{month}-{day}-{name}.md", parse_toc=True)
+    if not post:
+        abort(404)
+    return {"entry": post}
+
+
+def archive_page(posts: list[Entry], page_num: int, archive: dict[str, Any], endpoint: str, **values) -> dict[str, Any]:
+    # paginate the posts the same way as index pages
+    page_count = archive_page_count(len(posts))
+    if page_num < 1 or page_num > page_count:
+        abort(404)
+    prev_url, next_url = None, None
+    if page_num > 1:
+        prev_url = url_for(endpoint, page_num=page_num - 1, **values)
+    if page_num < page_count:
+        next_url = url_for(endpoint, page_num=page_num + 1, **values)
+    posts_per_page = config.get("posts_per_archive_page", 0)
+    if posts_per_page:
+        posts = posts[(page_num - 1) * posts_per_page : page_num * posts_per_page]
+    return {
+        "entries": list(posts),
+        "archive": archive,
+        "pager": {"prev_url": prev_url, "next_url": next_url},
+    }
+
+
+# page 1 of an archive has no "page/1/" part in its url, which redirects to it
+@app.route("/archive/", defaults={"page_num": 1})
+@app.route("/archive/page/<int:page_num>/")
+@app.route("/archive/<int(fixed_digits=4):year>/", defaults={"page_num": 1})
+@app.route("/archive/<int(fixed_digits=4):year>/page/<int:page_num>/")
+@app.route("/archive/<int(fixed_digits=4):year>/<int(fixed_digits=2):month>/", defaults={"page_num": 1})
+@app.route("/archive/<int(fixed_digits=4):year>/<int(fixed_digits=2):month>/page/<int:page_num>/")
+@templated("archive")
+def archive(page_num: int, year: Optional[int] = None, month: Optional[int] = None):
+    if year is None:
+        return archive_page(indexed_posts(), page_num, {"type": "Archive", "name": "All"}, "archive")
+    if month is None:
+        posts = indexed_archives().get((year,))
+        name, values = f"{year:04d}", {"year": year}
+    else:
+        posts = indexed_archives().get((year, month))
+        name, values = f"{year:04d}-{month:02d}", {"year": year, "month": month}
+    if not posts:
+        abort(404)
+    return archive_page(posts, page_num, {"type": "Archive", "name": name}, "archive", **values)
+
+
+@app.route("/category/<name>/", defaults={"page_num": 1})
+@app.route("/category/<name>/page/<int:page_num>/")
+@templated("archive")
+def category(name: str, page_num: int):
+    posts = indexed_taxonomy("categories").get(name, [])
+    return archive_page(posts, page_num, {"type": "Category", "name": name}, "category", name=name)
+
+
+@app.route("/tag/<name>/", defaults={"page_num": 1})
+@app.route("/tag/<name>/page/<int:page_num>/")
+@templated("archive")
+def tag(name: str, page_num: int):
+    posts = indexed_taxonomy("tags").get(name, [])
+    return archive_page(posts, page_num, {"type": "Tag", "name": name}, "tag", name=name)
+
+
+@app.route("/<any(categories, tags):kind>.json")
+def terms_json(kind: str):
+    if not config.get("taxonomy_terms"):
+        # the url is free for a raw file then
+        return page(f"{kind}.json")
+    if app.config.get("SERVING"):
+        mark_sources_modified(posts_mtimes(indexed_posts()))
+    return jsonify(indexed_terms(kind))
+
+
+@app.route("/<path:rel_url>")
+@templated("page")
+def page(rel_url: str):
+    page = load_page(rel_url, parse_toc=True)
+    if not page:
+        if rel_url.endswith("/"):
+            rel_url += "/index.html"
+        return send_from_directory(raw_folder, rel_url)
+    return {"entry": page}
+
+
+@app.errorhandler(404)
+@app.route("/404.html")
+def page_not_found(e=None):
+    with span("jinja"):
+        return render_template("404.html.j2"), 404
+
+
+def s2tz(tz_str):
+    m = re.match(r"UTC([+|-]\d{1,2}):(\d{2})", tz_str)
+    if m:  # in format 'UTC±[hh]:[mm]'
+        delta_h = int(m.group(1))
+        delta_m = int(m.group(2)) if delta_h >= 0 else -int(m.group(2))
+        return timezone(timedelta(hours=delta_h, minutes=delta_m))
+    import pytz
+
+    try:  # in format 'Asia/Shanghai'
+        return pytz.timezone(tz_str)
+    except pytz.UnknownTimeZoneError:
+        return None
+
+
+# serialized feed documents, keyed by their entries and configurations
+feed_cache = FeedCache()
+
+
+def feed_response(kind: str, posts: list[Entry], *, self_url: str, title: Optional[str] = None):
+    # self_url is the full url of the feed, urls of entries already contain the app root
+    posts = posts[: config.get("feed_entries", 10)]
+    root_url = request.host_url.rstrip("/")
+    home_full_url = url_for("index", _external=True)
+    feed_full_url = self_url
+    # the document only changes if the entries or configurations change
+    key = hash_key(
+        kind,
+        title,
+        feed_full_url,
+        [(p["filename"], post_index.stat(p["filename"])) for p in posts],
+        site,
+        config,
+    )
+
+    def generate() -> bytes:
+        follow_challenge = None
+        if kind == "rss" and config.get("feed_id") and config.get("user_id"):
+            follow_challenge = (config["feed_id"], config["user_id"])
+        with span("feed"):
+            return generate_feed(
+                kind,
+                # reuse the rendered html of entries
+                (lazy_post(p) for p in posts),
+                site=site,
+                root_url=root_url,
+                home_url=home_full_url,
+                self_url=feed_full_url,
+                tz=s2tz(site.get("timezone", "")) or timezone(timedelta()),
+                title=title,
+                follow_challenge=follow_challenge,
+            )
+
+    doc = feed_cache.get_or_generate(key, generate)
+    # make http response, answer conditional requests with 304
+    resp = make_response(doc)
+    resp.content_type = FEED_CONTENT_TYPES[kind]
+    if not app.config.get("BUILDING"):
+        resp.set_etag(key)
+        if posts:
+            resp.last_modified = datetime.fromtimestamp(
+                max(post_index.stat(p["filename"]) or (0, 0) for p in posts)[0] / 1e9, timezone.utc
+            )
+        resp.make_conditional(request)
+    return resp
+
+
+@app.route("/feed.xml")
+def feed():
+    return feed_response("rss", indexed_posts(), self_url=url_for("feed", _external=True))
+
+
+@app.route("/atom.xml")
+def atom_feed():
+    return feed_response("atom", indexed_posts(), self_url=url_for("atom_feed", _external=True))
+
+
+@app.route("/category/<name>/<any(feed, atom):kind>.xml")
+def category_feed(name: str, kind: str):
+    posts = indexed_taxonomy("categories").get(name)
+    if not posts:
+        abort(404)
+    self_url = url_for("category_feed", name=name, kind=kind, _external=True)
+    title = f"{site.get('title', '')} - {name}"
+    return feed_response("rss" if kind == "feed" else "atom", posts, self_url=self_url, title=title)
+
+
+@app.route("/tag/<name>/<any(feed, atom):kind>.xml")
+def tag_feed(name: str, kind: str):
+    posts = indexed_taxonomy("tags").get(name)
+    if not posts:
+        abort(404)
+    self_url = url_for("tag_feed", name=name, kind=kind, _external=True)
+    title = f"{site.get('title', '')} - {name}"
+    return feed_response("rss" if kind == "feed" else "atom", posts, self_url=self_url, title=title)
@@ -0,0 +1,298 @@
+"""
+Benchmarks of purepress on synthetic instances.
+
+`purepress bench` generates instances with the given numbers of posts, and
+measures each of them in fresh processes (`python -m purepress.bench`),
+first with an empty cache (cold) and then again with the cache left by the
+first run (warm). Results are written as JSON.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+BENCH_TOML = """\
+[site]
+title = "Bench"
+subtitle = "Synthetic instance for benchmarks"
+author = "Bench"
+timezone = "Asia/Shanghai"
+
+[config]
+posts_per_index_page = 20
+"""
+
+WORDS = (
+    "purepress flask markdown static blog generator python template theme index archive feed "
+    "cache build render post page tag category server client request response parser"
+).split()
+CJK_WORDS = "静态 博客 生成器 文章 标签 分类 渲染 缓存 构建 模板 主题 索引 归档 订阅 服务器 客户端 解析".split()
+LANGUAGES = ["python", "javascript", "bash", "json", "c", "go", "rust", "yaml"]
+
+
+def _sentence(rnd: random.Random) -> str:
+    if rnd.random() < 0.6:
+        return "".join(rnd.choices(CJK_WORDS, k=rnd.randint(8, 24))) + "。"
+    words = rnd.choices(WORDS, k=rnd.randint(8, 20))
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rnd: random.Random, footnotes: list[str]) -> str:
+    text = " ".join(_sentence(rnd) for _ in range(rnd.randint(2, 6)))
+    if rnd.random() < 0.2:
+        text += (
+            f" See [this post](/posts/{rnd.choice(WORDS)}.md) or [the docs](https://example.com/{rnd.choice(WORDS)})."
+        )
+    if rnd.random() < 0.15:
+        name = f"fn{len(footnotes) + 1}"
+        footnotes.append(f"[^{name}]: {_sentence(rnd)}")
+        text += f"[^{name}]"
+    return text
+
+
+def _code_block(rnd: random.Random) -> str:
+    lines = []
+    for i in range(rnd.randint(4, 30)):
+        indent = "    " * rnd.randint(0, 2)
+        lines.append(f"{indent}{rnd.choice(WORDS)}_{i} = {rnd.choice(WORDS)}({rnd.randint(0, 999)})")
+    return f"```{rnd.choice(LANGUAGES)}\n" + "\n".join(lines) + "\n```"
+
+
+def _table(rnd: random.Random) -> str:
+    cols = rnd.randint(2, 5)
+    rows = ["| " + " | ".join(rnd.choices(WORDS, k=cols)) + " |", "|" + " --- |" * cols]
+    for _ in range(rnd.randint(2, 8)):
+        rows.append("| " + " | ".join(str(rnd.randint(0, 9999)) for _ in range(cols)) + " |")
+    return "\n".join(rows)
+
+
+def synthetic_post(rnd: random.Random, index: int, tags: list[str], categories: list[str]) -> str:
+    footnotes: list[str] = []
+    blocks = []
+    for h2 in range(rnd.randint(2, 6)):
+        blocks.append(f"## {rnd.choice(WORDS).capitalize()} {h2 + 1}")
+        for h3 in range(rnd.randint(0, 3)):
+            blocks.append(f"### {rnd.choice(CJK_WORDS)} {h2 + 1}.{h3 + 1}")
+            blocks.append(_paragraph(rnd, footnotes))
+        for _ in range(rnd.randint(1, 4)):
+            r = rnd.random()
+            if r < 0.2:
+                blocks.append(_code_block(rnd))
+            elif r < 0.3:
+                blocks.append(_table(rnd))
+            elif r < 0.4:
+                blocks.append("\n".join(f"- {_sentence(rnd)}" for _ in range(rnd.randint(2, 6))))
+            elif r < 0.45:
+                blocks.append(f"![{rnd.choice(WORDS)}](/static/images/{rnd.choice(WORDS)}.png)")
+            else:
+                blocks.append(_paragraph(rnd, footnotes))
+    frontmatter = [
+        f"title: {_sentence(rnd)[:40]} {index}",
+        f"categories: {rnd.choice(categories)}",
+        f"tags: [{', '.join(sorted(set(rnd.choices(tags, k=rnd.randint(0, 4)))))}]",
+        f"created: {{created}} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00",
+    ]
+    if rnd.random() < 0.1:
+        frontmatter.append("toc_depth: 2")
+    return "---\n" + "\n".join(frontmatter) + "\n---\n\n" + "\n\n".join(blocks + footnotes) + "\n"
+
+
+def generate_instance(folder: Path, post_count: int, *, theme_folder: Path, seed: int = 0):
+    """
+    Generate a synthetic instance with post_count posts in folder.
+    An existing instance generated with the same parameters is reused.
+    """
+    marker = folder / ".bench-instance"
+    params = json.dumps({"post_count": post_count, "seed": seed})
+    if marker.is_file() and marker.read_text() == params:
+        return
+    if folder.exists():
+        shutil.rmtree(folder)
+    rnd = random.Random(seed)
+    tags = [f"tag-{i}" for i in range(max(10, post_count // 20))]
+    categories = [f"Category{i}" for i in range(max(3, post_count // 200))]
+    (folder / "posts").mkdir(parents=True)
+    (folder / "pages" / "about").mkdir(parents=True)
+    (folder / "static").mkdir()
+    (folder / "raw").mkdir()
+    if theme_folder.is_dir():
+        shutil.copytree(theme_folder, folder / "theme")
+    (folder / "purepress.toml").write_text(BENCH_TOML, encoding="utf-8")
+    (folder / "pages" / "about" / "index.md").write_text(
+        "---\ntitle: About\n---\n\n" + synthetic_post(rnd, 0, tags, categories).split("---\n", 2)[2],
+        encoding="utf-8",
+    )
+    for i in range(post_count):
+        # spread the posts over the days since 2000-01-01
+        day = time.gmtime(946684800 + i * 86400 * 7300 // max(post_count, 1))
+        created = time.strftime("%Y-%m-%d", day)
+        content = synthetic_post(rnd, i, tags, categories).replace("{created}", created)
+        with open(folder / "posts" / f"{created}-synthetic-post-{i}.md", "w", encoding="utf-8") as f:
+            f.write(content)
+    marker.write_text(params)
+
+
+def _timed(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def _timed_repeat(fn: Callable[[], Any], repeat: int) -> dict[str, float]:
+    timings = [_timed(fn) for _ in range(repeat)]
+    return {"first": timings[0], "mean": sum(timings) / len(timings), "min": min(timings)}
+
+
+def measure_instance(url_root: str, *, build: bool, repeat: int, sample: int) -> dict[str, Any]:
+    """
+    Measure the instance selected by PUREPRESS_INSTANCE in the current process.
+    """
+    from .console import step_timings
+    from .application import _markdown_convert
+    from . import app, toc, builder, load_post, load_posts, posts_folder
+
+    results: dict[str, Any] = {}
+    with app.test_request_context():
+        results["load_posts_meta"] = _timed_repeat(lambda: load_posts(meta_only=True), repeat)
+        posts = load_posts(meta_only=True)
+        filenames = [p["filename"] for p in posts[:sample]]
+        results["load_entry_meta"] = _timed(lambda: [load_post(f, meta_only=True) for f in filenames])
+        results["load_entry_full"] = _timed(lambda: [load_post(f, parse_toc=True) for f in filenames])
+
+    bodies = []
+    for filename in filenames:
+        with open(posts_folder / filename, encoding="utf-8") as f:
+            bodies.append(f.read().split("---", 2)[2])
+    converted: list[dict[str, Any]] = []
+    with app.test_request_context():
+        results["markdown_convert"] = _timed(
+            lambda: converted.extend(_markdown_convert(b, parse_toc=True) for b in bodies)
+        )
+
+    def make_tocs():
+        for c in converted:
+            toc.toc_html(toc.make_toc(c["headings"]))
+
+    results["toc"] = _timed(make_tocs)
+    results["sample_size"] = len(filenames)
+
+    routes = ["/", "/archive/", "/feed.xml"]
+    if posts:
+        routes.append(posts[0]["url"])
+        if posts[0].get("tags"):
+            routes.append(f"/tag/{posts[0]['tags'][0]}/")
+        if posts[0].get("categories"):
+            routes.append(f"/category/{posts[0]['categories'][0]}/")
+    with app.test_client() as client:
+        results["routes"] = {route: _timed_repeat(lambda: client.get(route), repeat) for route in routes}
+
+    if build:
+        start = time.perf_counter()
+        with builder.PageRenderer(builder.configure_build(url_root)) as renderer:
+            builder.build(lambda urls: map(renderer.render, urls), url_root=url_root)
+        results["build"] = {"total": time.perf_counter() - start, "steps": dict(step_timings)}
+    return results
+
+
+def run_benchmarks(
+    sizes: list[int],
+    *,
+    workdir: Path,
+    theme_folder: Path,
+    build: bool = True,
+    repeat: int = 5,
+    sample: int = 50,
+    echo: Callable[[str], Any] = print,
+) -> dict[str, Any]:
+    """
+    Generate an instance of each size, and measure it cold and warm in fresh processes.
+    """
+    report: dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "instances": {},
+    }
+    for size in sizes:
+        folder = workdir / str(size)
+        echo(f"Generating instance with {size} posts...")
+        report["instances"][str(size)] = instance = {
+            "generate": _timed(lambda: generate_instance(folder, size, theme_folder=theme_folder))
+        }
+        shutil.rmtree(folder / ".purepress-cache", ignore_errors=True)
+        env = dict(os.environ, PUREPRESS_INSTANCE=folder.as_posix())
+        # the cli must start fast, the app is only imported by commands that need it
+        instance["import"] = {
+            "cli": _import_time("purepress.__main__", env),
+            "app": _import_time("purepress.application", env),
+        }
+        for run in ("cold", "warm"):
+            echo(f"Measuring instance with {size} posts ({run})...")
+            output = folder / f".bench-{run}.json"
+            args = [
+                sys.executable,
+                "-m",
+                "purepress.bench",
+                output.as_posix(),
+                f"--repeat={repeat}",
+                f"--sample={sample}",
+            ]
+            if not build:
+                args.append("--no-build")
+            subprocess.run(args, env=env, check=True, stdout=subprocess.DEVNULL)
+            with open(output, encoding="utf-8") as f:
+                instance[run] = json.load(f)
+    return report
+
+
+def _import_time(module: str, env: dict[str, str]) -> float:
+    """Seconds to import the module in a fresh process, as reported by `python -X importtime`."""
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # import time: self [us] | cumulative | imported package
+    for line in res.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1e6
+    return 0.0
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        res = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return res.stdout.strip()
+
+
+def main(argv: list[str]):
+    # entry of the measuring process, see run_benchmarks
+    output, *options = argv
+    build, repeat, sample = True, 5, 50
+    for option in options:
+        if option == "--no-build":
+            build = False
+        elif option.startswith("--repeat="):
+            repeat = int(option.split("=", 1)[1])
+        elif option.startswith("--sample="):
+            sample = int(option.split("=", 1)[1])
+    results = measure_instance("http://localhost/", build=build, repeat=repeat, sample=sample)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,605 @@
+"""
+Building the site into the build folder, see `purepress build`.
+"""
+
+import os
+import json
+import hashlib
+import traceback
+from pathlib import Path
+from urllib.parse import urlparse
+from typing import Callable, Iterable, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from flask import g, url_for
+from werkzeug.exceptions import HTTPException
+
+from .cache import hash_key
+from .profiling import span
+from .sync import sync_file
+from .__meta__ import __version__
+from .manifest import BuildManifest
+from .console import echo, step, echo_red, echo_green, echo_yellow
+from . import (
+    app,
+    config,
+    images,
+    search,
+    load_post,
+    profiling,
+    load_posts,
+    post_index,
+    raw_folder,
+    check_links,
+    root_folder,
+    cache_folder,
+    pages_folder,
+    posts_folder,
+    render_cache,
+    static_folder,
+    image_settings,
+    rendered_links,
+    template_folder,
+    indexed_archives,
+    indexed_taxonomy,
+    preload_templates,
+    archive_page_count,
+    asset_fingerprints,
+    theme_static_folder,
+    image_derivatives_folder,
+)
+
+
+def configure_build(url_root: str) -> str:
+    """
+    Configure the app for building with the given url root.
+    Returns the path part of the url root.
+    """
+    res = urlparse(url_root)
+    app_root = res.path or "/"
+    app.config["PREFERRED_URL_SCHEME"] = res.scheme or "http"
+    app.config["SERVER_NAME"] = res.netloc or "localhost"
+    app.config["APPLICATION_ROOT"] = app_root
+    # mark as 'BUILDING' status, so that templates can react properly,
+    app.config["BUILDING"] = True
+    # sources do not change during build, skip checking them on every request
+    post_index.freeze()
+    preload_templates()
+    return app_root
+
+
+class PageRenderer:
+    """
+    Render urls of the site by calling the view functions directly, in a
+    fresh request context for every url (so views and templates see the
+    request of the page), within a single app context reused for all urls.
+    """
+
+    def __init__(self, app_root: str):
+        self.app_root = app_root
+        self.app_ctx = app.app_context()
+
+    def __enter__(self):
+        self.app_ctx.push()
+        # when profiling, render pages at once so that the time is attributed to them
+        g.stream_templates = profiling.active() is None
+        return self
+
+    def __exit__(self, *exc_info):
+        self.app_ctx.pop()
+
+    def render(self, url: str) -> tuple[int, Iterable[bytes]]:
+        """Render the url, returns the status code and the chunks of the body."""
+        # the path of the request context is relative to the app root
+        path = "/" + url[len(self.app_root) :].lstrip("/") if url.startswith(self.app_root) else url
+        # streamed templates keep the request context while generating, see flask.stream_with_context
+        with span(url, "page") as args, app.test_request_context(path):
+            try:
+                rv = app.dispatch_request()
+            except HTTPException as e:
+                rv = app.handle_user_exception(e)
+            res = app.make_response(rv)
+            if profiling.active() is not None:
+                data = res.get_data()
+                res.close()
+                args["bytes"] = len(data)
+                return res.status_code, [data]
+
+        def chunks():
+            try:
+                yield from res.iter_encoded()
+            finally:
+                res.close()
+
+        return res.status_code, chunks()
+
+
+# page renderer of the current build worker process
+_worker_renderer: Optional[PageRenderer] = None
+
+
+def _init_build_worker(url_root: str, fingerprints: dict[tuple[str, str], str], profile: bool):
+    global _worker_renderer
+    asset_fingerprints.update(fingerprints)
+    if profile:
+        profiling.enable()
+    _worker_renderer = PageRenderer(configure_build(url_root)).__enter__()
+
+
+def _build_worker_render(url: str) -> tuple[int, list[bytes], dict[str, list[str]], list[dict]]:
+    assert _worker_renderer is not None
+    status_code, chunks = _worker_renderer.render(url)
+    data = b"".join(chunks)
+    # hand the links over to the main process
+    links = {source: list(source_links) for source, source_links in rendered_links.items()}
+    rendered_links.clear()
+    profiler = profiling.active()
+    return status_code, [data], links, profiler.drain() if profiler else []
+
+
+def build_site(
+    url_root: str,
+    *,
+    incremental: bool = False,
+    jobs: int = 1,
+    profile: Optional[str] = None,
+    profile_format: str = "chrome",
+    profile_top: int = 10,
+):
+    """
+    Build the site (see `build`), rendering with jobs processes, and report
+    the profile of the build if a file to write it to is given.
+    """
+    app_root = configure_build(url_root)
+    if not urlparse(url_root).netloc:
+        echo_yellow('The url root does not contain a valid server name, "localhost" will be used.')
+    jobs = jobs or os.cpu_count() or 1
+    profiler = profiling.enable() if profile else None
+
+    try:
+        if jobs > 1:
+            # workers are started on the first render, after the assets are fingerprinted
+            with ProcessPoolExecutor(
+                jobs, initializer=_init_build_worker, initargs=(url_root, asset_fingerprints, bool(profile))
+            ) as executor:
+
+                def render_urls(urls: list[str]) -> Iterator[tuple[int, Iterable[bytes]]]:
+                    chunksize = max(1, len(urls) // (jobs * 4))
+                    results = executor.map(_build_worker_render, urls, chunksize=chunksize)
+                    for status_code, chunks, links, events in results:
+                        for source, source_links in links.items():
+                            rendered_links.setdefault(source, set()).update(source_links)
+                        if profiler is not None:
+                            profiler.extend(events)
+                        yield status_code, chunks
+
+                build(render_urls, url_root=url_root, incremental=incremental)
+        else:
+            with PageRenderer(app_root) as renderer:
+
+                def render_urls(urls: list[str]) -> Iterator[tuple[int, Iterable[bytes]]]:
+                    return map(renderer.render, urls)
+
+                build(render_urls, url_root=url_root, incremental=incremental)
+        echo_green('OK! Now you can find the built site in the "build" folder.')
+        if profiler is not None:
+            events = profiler.drain()
+            profiling.write_profile(profile, events, fmt=profile_format)
+            for line in profiling.format_summary(profiling.summarize(events, top=profile_top)):
+                echo(line)
+            echo_green(f'The profile is written to "{profile}".')
+    except Exception:
+        traceback.print_exc()
+        echo_red("Failed to build the site.")
+        exit(1)
+
+
+def build(
+    render_urls: Callable[[list[str]], Iterable[tuple[int, Iterable[bytes]]]],
+    *,
+    url_root: str = "",
+    incremental: bool = False,
+):
+    """
+    Build the site into the build folder.
+    The render_urls callable renders a batch of urls, and yields (status code, chunks)
+    of each url in the same order, possibly rendering them in parallel.
+    """
+    # prepare folder paths
+    build_folder = root_folder / "build"
+    build_static_folder = build_folder / "static"
+    build_static_theme_folder = build_static_folder / "theme"
+    build_images_folder = build_static_folder / "_images"
+    build_pages_folder = build_folder
+    build_posts_folder = build_folder / "post"
+    build_categories_folder = build_folder / "category"
+    build_tags_folder = build_folder / "tag"
+    build_archive_folder = build_folder / "archive"
+    build_index_page_folder = build_folder / "page"
+
+    # the manifest of the last build tells which outputs are still fresh
+    manifest_path = cache_folder / "build-manifest.json"
+    manifest = BuildManifest.load(manifest_path, root_folder, build_folder)
+    if not incremental or not manifest.has_previous or not build_folder.is_dir():
+        incremental = False
+        manifest = BuildManifest(manifest_path, root_folder, build_folder)
+    manifest.config_hash = hash_key(manifest.file_hash(root_folder / "purepress.toml"), url_root, __version__)
+    manifest.templates_hash = manifest.folder_hash(template_folder)
+
+    def render(tasks: list[tuple[str, Path, list[Path], tuple]]):
+        """
+        Render each (url, dst_path, sources, extra) task to dst_path,
+        unless the output is still fresh.
+        """
+        pending = []
+        for url, dst_path, sources, extra in tasks:
+            signature = manifest.signature(sources, url, *extra)
+            if manifest.is_fresh(dst_path, signature):
+                manifest.record(dst_path, sources, signature)
+            else:
+                pending.append((url, dst_path, sources, signature))
+        results = render_urls([url for url, _, _, _ in pending])
+        for (_, dst_path, sources, signature), (_, chunks) in zip(pending, results):
+            with span("write") as args, open(dst_path, "wb") as f:
+                f.writelines(chunks)
+                args["bytes"] = f.tell()
+            manifest.record(dst_path, sources, signature)
+
+    def post_sources(posts: list[dict]) -> list[Path]:
+        return [posts_folder / p["filename"] for p in posts]
+
+    def url(endpoint: str, **values) -> str:
+        with app.test_request_context():
+            return url_for(endpoint, **values)
+
+    def archive_tasks(folder: Path, posts: list[dict], endpoint: str, **values) -> list:
+        """Tasks of all pages of an archive, the first page is rendered in folder."""
+        page_count = archive_page_count(len(posts))
+        posts_per_page = config.get("posts_per_archive_page", 0) or len(posts)
+        tasks = []
+        for page_num in range(1, page_count + 1):
+            page_folder = folder if page_num == 1 else folder / "page" / str(page_num)
+            page_folder.mkdir(parents=True, exist_ok=True)
+            page_posts = posts[(page_num - 1) * posts_per_page : page_num * posts_per_page]
+            tasks.append(
+                (
+                    url(endpoint, page_num=page_num, **values),
+                    page_folder / "index.html",
+                    post_sources(page_posts),
+                    (page_count,),
+                )
+            )
+        return tasks
+
+    with step("Creating build folder"):
+        # the existing build folder is reused, files not produced by this build are removed at the end
+        if os.path.exists(build_folder) and not os.path.isdir(build_folder):
+            os.remove(build_folder)
+        os.makedirs(build_folder, exist_ok=True)
+
+    with step("Copying raw files"):
+        copy_folder_content(raw_folder, build_folder, manifest)
+
+    with step("Copying theme static files"):
+        os.makedirs(build_static_theme_folder, exist_ok=True)
+        copy_folder_content(theme_static_folder, build_static_theme_folder, manifest)
+
+    with step("Copying static files"):
+        copy_folder_content(static_folder, build_static_folder, manifest)
+
+    if config.get("fingerprint_assets"):
+        with step("Fingerprinting assets"):
+            asset_fingerprints.clear()
+            asset_fingerprints.update(
+                fingerprint_folder_content(theme_static_folder, build_static_theme_folder, "theme.static", manifest)
+            )
+            asset_fingerprints.update(
+                fingerprint_folder_content(static_folder, build_static_folder, "static", manifest)
+            )
+        # pages link to the fingerprinted names, so they must be rebuilt if any of them changes
+        manifest.config_hash = hash_key(manifest.config_hash, sorted(asset_fingerprints.items()))
+
+    if image_settings() is not None:
+        with step("Resizing images"):
+            derivatives = build_image_derivatives(build_images_folder, manifest)
+        # pages have the sizes and derivatives of images, so they must be rebuilt if any image changes
+        manifest.config_hash = hash_key(manifest.config_hash, derivatives)
+
+    # posts are grouped by category, tag and date in one pass over their metadata, see PostIndex
+    with app.test_request_context():
+        posts = load_posts(meta_only=True)
+        categories = indexed_taxonomy("categories")
+        tags = indexed_taxonomy("tags")
+        archives = indexed_archives()
+    if config.get("taxonomy_terms"):
+        # any page can show the terms, e.g. as a tag cloud, so they must all be rebuilt if the counts change
+        term_counts = [sorted((name, len(v)) for name, v in taxonomy.items()) for taxonomy in (categories, tags)]
+        manifest.config_hash = hash_key(manifest.config_hash, term_counts)
+
+    with step("Building custom pages"):
+        tasks = []
+        for dirname, _, files in os.walk(pages_folder):
+            if os.path.basename(dirname).startswith("."):
+                continue
+            rel_dirname = os.path.relpath(dirname, pages_folder)
+            (build_pages_folder / rel_dirname).mkdir(parents=True, exist_ok=True)
+            for file in filter(lambda f: not f.startswith("."), files):
+                rel_path = Path(rel_dirname) / file
+                dst_rel_path = rel_path.with_suffix(".html")
+                dst_path = build_pages_folder / dst_rel_path
+                rel_url = dst_rel_path.as_posix()
+                tasks.append((url("page", rel_url=rel_url), dst_path, [pages_folder / rel_path], ()))
+        render(tasks)
+
+    with step("Building posts"):
+        tasks = []
+        for post in posts:
+            filename = post["filename"]
+            year, month, day, name = Path(filename).stem.split("-", maxsplit=3)
+            dst_dir = build_posts_folder / year / month / day / name
+            dst_dir.mkdir(parents=True, exist_ok=True)
+            post_url = url("post", year=year, month=month, day=day, name=name)
+            tasks.append((post_url, dst_dir / "index.html", post_sources([post]), ()))
+        render(tasks)
+
+    if config.get("search_index"):
+        with step("Building search index"):
+            write_search_index(build_folder / "search", posts, manifest)
+
+    with step("Building categories"):
+        tasks = []
+        for category, category_posts in categories.items():
+            tasks += archive_tasks(build_categories_folder / category, category_posts, "category", name=category)
+        render(tasks)
+
+    with step("Building tags"):
+        tasks = []
+        for tag, tag_posts in tags.items():
+            tasks += archive_tasks(build_tags_folder / tag, tag_posts, "tag", name=tag)
+        render(tasks)
+
+    if config.get("taxonomy_terms"):
+        with step("Building taxonomy terms"):
+            tasks = [
+                (url("terms_json", kind=kind), build_folder / f"{kind}.json", post_sources(posts), ())
+                for kind in ("categories", "tags")
+            ]
+            render(tasks)
+
+    with step("Building archive"):
+        tasks = archive_tasks(build_archive_folder, posts, "archive")
+        if config.get("archive_by_date"):
+            for key, archive_posts in archives.items():
+                values = dict(zip(("year", "month"), key))
+                folder = build_archive_folder.joinpath(*(f"{v:0{n}d}" for v, n in zip(key, (4, 2))))
+                tasks += archive_tasks(folder, archive_posts, "archive", **values)
+        render(tasks)
+
+    with step("Building index"):
+        posts_per_page = config["posts_per_index_page"]
+        page_count = max(1, (len(posts) + posts_per_page - 1) // posts_per_page)
+
+        def page_sources(page_num: int) -> list[Path]:
+            return post_sources(posts[(page_num - 1) * posts_per_page : page_num * posts_per_page])
+
+        tasks = [(url("index"), build_folder / "index.html", page_sources(1), (page_count,))]
+        for page_num in range(2, page_count + 1):
+            page_folder = build_index_page_folder / str(page_num)
+            os.makedirs(page_folder, exist_ok=True)
+            page_url = url("index_page", page_num=page_num)
+            tasks.append((page_url, page_folder / "index.html", page_sources(page_num), (page_count,)))
+        render(tasks)
+
+    with step("Building feed"):
+        feed_entries = config.get("feed_entries", 10)
+        tasks = [
+            (url("feed"), build_folder / "feed.xml", post_sources(posts[:feed_entries]), ()),
+            (url("atom_feed"), build_folder / "atom.xml", post_sources(posts[:feed_entries]), ()),
+        ]
+        if config.get("taxonomy_feeds"):
+            for endpoint, folder, taxonomy in (
+                ("category_feed", build_categories_folder, categories),
+                ("tag_feed", build_tags_folder, tags),
+            ):
+                for name, taxonomy_posts in taxonomy.items():
+                    for kind in ("feed", "atom"):
+                        tasks.append(
+                            (
+                                url(endpoint, name=name, kind=kind),
+                                folder / name / f"{kind}.xml",
+                                post_sources(taxonomy_posts[:feed_entries]),
+                                (),
+                            )
+                        )
+        render(tasks)
+
+    with step("Building 404"):
+        render([(url("page_not_found"), build_folder / "404.html", [], ())])
+
+    if config.get("compress_outputs"):
+        with step("Compressing outputs"):
+            compress_outputs(manifest)
+
+    with step("Removing stale outputs"):
+        for path in manifest.stale_outputs():
+            remove_output(path, build_folder)
+
+    # links in the sources not rendered again are checked too, their targets may be gone
+    for source, source_links in rendered_links.items():
+        manifest.record_links(source, source_links)
+    rendered_links.clear()
+    with app.test_request_context():
+        broken_links = check_links(manifest.source_links())
+    manifest.save()
+
+    if broken_links:
+        echo_yellow(f"Found {len(broken_links)} broken internal link(s):")
+        for source, link in broken_links:
+            echo_yellow(f"  {source}: {link}")
+
+
+def copy_folder_content(src: Path, dst: Path, manifest: Optional[BuildManifest] = None):
+    """
+    Sync all content in src directory to dst directory.
+    The src and dst must exist.
+    Files already copied to dst are skipped, at the cost of a stat, and
+    new files are hard linked or cloned if configured and supported.
+    If a manifest is given, the copied files are recorded as outputs.
+    """
+    if not src.is_dir():
+        return
+    link = config.get("link_static_files", False)
+    checksum = manifest.file_hash if manifest is not None and config.get("checksum_static_files") else None
+    for dirname, _, files in os.walk(src, followlinks=True):
+        dst_dirname = dst / os.path.relpath(dirname, src)
+        if not dst_dirname.is_dir():
+            if os.path.lexists(dst_dirname):
+                os.remove(dst_dirname)
+            dst_dirname.mkdir()
+        for file in files:
+            src_path, dst_path = Path(dirname) / file, dst_dirname / file
+            sync_file(src_path, dst_path, link=link, checksum=checksum)
+            if manifest is not None:
+                manifest.record(dst_path, [src_path], "")
+
+
+def fingerprint_folder_content(
+    src: Path, dst: Path, endpoint: str, manifest: BuildManifest
+) -> dict[tuple[str, str], str]:
+    """
+    Copy all files in src directory to dst directory, with the content hash
+    in their names, e.g. style.css -> style.0123456789.css.
+    Returns the fingerprinted filenames, keyed by the endpoint and filenames.
+    """
+    if not src.is_dir():
+        return {}
+    files = []
+    for dirname, _, filenames in os.walk(src, followlinks=True):
+        files += [Path(dirname) / file for file in filenames]
+
+    def fingerprint(src_path: Path) -> tuple[tuple[str, str], str]:
+        rel_path = src_path.relative_to(src)
+        digest = manifest.file_hash(src_path)[:10]
+        fingerprinted = rel_path.with_name(f"{rel_path.stem}.{digest}{rel_path.suffix}")
+        dst_path = dst / fingerprinted
+        dst_path.parent.mkdir(parents=True, exist_ok=True)
+        sync_file(src_path, dst_path, link=config.get("link_static_files", False))
+        manifest.record(dst_path, [src_path], digest)
+        return (endpoint, rel_path.as_posix()), fingerprinted.as_posix()
+
+    with ThreadPoolExecutor() as executor:
+        return dict(executor.map(fingerprint, files))
+
+
+COMPRESSED_SUFFIXES = {".html", ".css", ".js", ".xml", ".svg"}
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def compress_outputs(manifest: BuildManifest):
+    """
+    Write .gz (and .br, if brotli is installed) siblings of the textual outputs,
+    for servers and CDNs to serve without compressing on the fly.
+    """
+    from .serve import compress, available_encodings
+
+    encodings = available_encodings()
+    outputs = [
+        manifest.build_folder / rel for rel in list(manifest.outputs) if os.path.splitext(rel)[1] in COMPRESSED_SUFFIXES
+    ]
+
+    def compress_output(path: Path):
+        data = None
+        for encoding in encodings:
+            dst_path = path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+            signature = manifest.signature([path], encoding, with_globals=False)
+            if not manifest.is_fresh(dst_path, signature):
+                if data is None:
+                    data = path.read_bytes()
+                dst_path.write_bytes(compress(data, encoding, best=True))
+            manifest.record(dst_path, [path], signature)
+
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(compress_output, outputs))
+
+
+def build_image_derivatives(folder: Path, manifest: BuildManifest) -> list[str]:
+    """
+    Resize the images in the static folder to the configured widths, and
+    sync the derivatives into folder. Derivatives are cached by the content
+    of their sources, so only new or changed images are resized, in parallel
+    threads whatever the number of jobs (Pillow releases the GIL while
+    resizing). Returns the names of the derivatives.
+    """
+    settings = image_settings()
+    assert settings is not None
+    fmt = settings["format"]
+    tasks = []
+    for dirname, _, files in os.walk(static_folder, followlinks=True):
+        for file in files:
+            info = images.image_info(Path(dirname) / file)
+            if info is None:
+                continue
+            for width in images.derivative_widths(info, settings["widths"], fmt):
+                tasks.append((info.path, image_derivatives_folder / images.derivative_name(info, width, fmt), width))
+    folder.mkdir(parents=True, exist_ok=True)
+    link = config.get("link_static_files", False)
+
+    def make(task: tuple[Path, Path, int]) -> Path:
+        src_path, cached_path, width = task
+        images.make_derivative(src_path, cached_path, width, fmt, quality=settings["quality"])
+        dst_path = folder / cached_path.name
+        sync_file(cached_path, dst_path, link=link)
+        return dst_path
+
+    with ThreadPoolExecutor() as executor:
+        for (src_path, _, _), dst_path in zip(tasks, executor.map(make, tasks)):
+            manifest.record(dst_path, [src_path], "")
+    return sorted(cached_path.name for _, cached_path, _ in tasks)
+
+
+def write_search_index(folder: Path, posts: list[dict], manifest: BuildManifest):
+    """
+    Write the search index of the posts into folder, as index.json with the
+    documents and a JSON file of each shard of terms.
+    The terms of each post are cached by its source, and the html of posts
+    comes from the render cache, so only changed posts are processed again.
+    """
+    docs, doc_terms = [], []
+    for post in posts:
+        source = posts_folder / post["filename"]
+        key = hash_key("search-terms", search.SEARCH_VERSION, manifest.file_hash(source))
+        terms = render_cache.get(key)
+        if terms is None:
+            with app.test_request_context():
+                # with the toc, as rendered for the post page, so that the html comes from the render cache
+                full_post = load_post(post["filename"], parse_toc=True) or {}
+            taxonomy = post.get("categories", []) + post.get("tags", [])
+            terms = search.post_terms(post["title"], taxonomy, full_post.get("content", ""))
+            render_cache.set(key, terms)
+        docs.append({"url": post["url"], "title": post["title"], "date": post["created"].strftime("%Y-%m-%d")})
+        doc_terms.append(terms)
+
+    index, shards = search.build_index(docs, doc_terms)
+    folder.mkdir(parents=True, exist_ok=True)
+    files = {"index.json": index, **{f"{name}.json": shard for name, shard in shards.items()}}
+    for filename, obj in files.items():
+        data = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+        path, signature = folder / filename, hashlib.sha256(data).hexdigest()
+        # unchanged shards are not written again
+        if not manifest.is_fresh(path, signature):
+            path.write_bytes(data)
+        manifest.record(path, [], signature)
+
+
+def remove_output(path: Path, build_folder: Path):
+    """
+    Remove an output file, and then its parent folders if they become empty.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    parent = path.parent
+    while parent != build_folder and parent.is_dir() and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
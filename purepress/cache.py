@@ -0,0 +1,132 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from jinja2.bccache import Bucket, FileSystemBytecodeCache
+
+
+def hash_key(*parts: Any) -> str:
+    """Make a stable content-addressed key from some json-serializable parts."""
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed cache of json values stored on disk, one file per key.
+
+    The total size is bounded by *max_size* bytes. Hits refresh the file mtime,
+    and the least recently used files are evicted first when the cache grows
+    beyond the limit. Any I/O failure just turns into a cache miss.
+    """
+
+    def __init__(self, folder: Path, max_size: int = 64 * 1024 * 1024):
+        self.folder = folder
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._sizes: Optional[dict[str, int]] = None
+        self._total = 0
+
+    def _path(self, key: str) -> Path:
+        return self.folder / key[:2] / f"{key}.json"
+
+    def _scan(self):
+        # load sizes of existing files lazily, on first write
+        self._sizes, self._total = {}, 0
+        if not self.folder.is_dir():
+            return
+        for path in self.folder.glob("*/*.json"):
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            self._sizes[path.stem] = size
+            self._total += size
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def set(self, key: str, value: Any):
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            if self._sizes is None:
+                self._scan()
+            else:
+                self._total += len(data) - self._sizes.get(key, 0)
+                self._sizes[key] = len(data)
+            if self._total > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        assert self._sizes is not None
+        entries = []
+        for key in self._sizes:
+            try:
+                entries.append((self._path(key).stat().st_mtime_ns, key))
+            except OSError:
+                entries.append((0, key))
+        entries.sort()
+        # evict down to 90% of the limit, so that we don't evict on every write
+        target = self.max_size * 9 // 10
+        for _, key in entries:
+            if self._total <= target:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._total -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            for path in self.folder.glob("*/*.json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._sizes, self._total = {}, 0
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """
+    Compiled Jinja templates stored on disk, shared by all processes of the
+    instance. Jinja checks the checksum of the source, so stale bytecode of
+    changed templates is never used. Failing to write is not an error.
+    """
+
+    def __init__(self, folder: Path):
+        super().__init__(os.fspath(folder))
+
+    def dump_bytecode(self, bucket: Bucket):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
@@ -0,0 +1,26 @@
+import time
+import functools
+from contextlib import contextmanager
+
+import click
+
+from .profiling import span
+
+echo = click.echo
+echo_green = functools.partial(click.secho, fg="green")
+echo_red = functools.partial(click.secho, fg="red")
+echo_yellow = functools.partial(click.secho, fg="yellow")
+
+
+# elapsed seconds of each step of the last operation, e.g. build
+step_timings: dict[str, float] = {}
+
+
+@contextmanager
+def step(op_name: str):
+    echo(f"{op_name}...", nl=False)
+    start = time.perf_counter()
+    with span(op_name, "step"):
+        yield
+    step_timings[op_name] = elapsed = time.perf_counter() - start
+    echo_green(f"OK ({elapsed:.2f}s)")
@@ -0,0 +1,295 @@
+import os
+import sys
+import math
+import threading
+from pathlib import Path
+from collections.abc import MutableMapping
+from typing import Any, Callable, Iterator, Optional
+
+# fields most entries have (or get lazily), stored in slots instead of a dict per entry
+ENTRY_FIELDS = (
+    "filename",
+    "url",
+    "title",
+    "created",
+    "updated",
+    "categories",
+    "tags",
+    "hide",
+    "content",
+    "excerpt",
+    "toc",
+    "toc_html",
+)
+_entry_fields = frozenset(ENTRY_FIELDS)
+
+
+class Entry(MutableMapping):
+    """
+    A post or page: its frontmatter plus the derived fields, e.g. `url` and
+    `content`. Behaves like a dict (`entry["title"]`, `entry.get("hide")`),
+    and templates can read fields as `entry.title`.
+
+    Common fields are kept in slots, the rest of the frontmatter in a dict
+    only created if needed, and category and tag names are interned, so
+    that an index of many entries stays small.
+
+    Heavy fields (e.g. `content`) can be computed lazily: each lazy field maps
+    to a loader returning a dict of fields, which are all merged into the
+    entry once the loader is called, so one loader can provide several fields.
+    Lazy fields are keys like any other (`in`, iteration and `len` count them
+    without loading them), but reading their values, e.g. with `entry.items()`
+    or `dict(entry)`, loads them.
+    """
+
+    __slots__ = ENTRY_FIELDS + ("_extra", "_lazy")
+
+    def __init__(self, fields: Any = (), *, lazy: Optional[dict[str, Callable[[], dict[str, Any]]]] = None, **kwargs):
+        self._extra: Optional[dict[str, Any]] = None
+        self._lazy = dict(lazy) if lazy else None
+        self.update(fields, **kwargs)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _entry_fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        return self._load(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key in ("categories", "tags") and isinstance(value, list):
+            value = [sys.intern(v) if isinstance(v, str) else v for v in value]
+        if key in _entry_fields:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in _entry_fields:
+            try:
+                delattr(self, key)
+                return
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def _loaded(self) -> Iterator[str]:
+        for key in ENTRY_FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        # a snapshot, as reading a lazy field while iterating loads it into the entry
+        keys = list(self._loaded())
+        if self._lazy is not None:
+            loaded = set(keys)
+            keys.extend(key for key in self._lazy if key not in loaded)
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: object) -> bool:
+        if key in _entry_fields:
+            if hasattr(self, key):  # type: ignore
+                return True
+        elif self._extra is not None and key in self._extra:
+            return True
+        return self._lazy is not None and key in self._lazy
+
+    def __repr__(self) -> str:
+        lazy = f", lazy={list(self._lazy)!r}" if self._lazy else ""
+        return f"Entry({ {key: self[key] for key in self._loaded()}!r}{lazy})"
+
+    def _load(self, key: str) -> Any:
+        loader = self._lazy.pop(key, None) if self._lazy is not None else None
+        if loader is None:
+            raise KeyError(key)
+        fields = loader()
+        for k in fields:
+            self._lazy.pop(k, None)  # type: ignore
+        self.update(fields)
+        return self[key]
+
+    def copy(self, *, lazy: Optional[dict[str, Callable[[], dict[str, Any]]]] = None) -> "Entry":
+        """A shallow copy of the entry, with lazy fields replaced if given."""
+        return Entry({key: self[key] for key in self._loaded()}, lazy=self._lazy if lazy is None else lazy)
+
+
+class PostIndex:
+    """
+    In-process index of post metadata.
+
+    Parsed metadata is kept per file and only reloaded when the (mtime, size)
+    of that file changes. The sorted post list, the category/tag inverted
+    indexes and the year/month archives are rebuilt only when something
+    changed, so listing routes can slice them directly instead of rescanning
+    the posts folder.
+    """
+
+    def __init__(self, folder: Path, loader: Callable[[str], Optional[Entry]]):
+        self.folder = folder
+        self.loader = loader
+        self._lock = threading.RLock()
+        self._stats: dict[str, tuple[int, int]] = {}
+        self._entries: dict[str, Optional[Entry]] = {}
+        self._posts: list[Entry] = []
+        self._categories: dict[str, list[Entry]] = {}
+        self._tags: dict[str, list[Entry]] = {}
+        self._archives: dict[tuple[int, ...], list[Entry]] = {}
+        self._dirty: set[str] = set()
+        self._scope: Any = None
+        self._loaded = False
+        self._frozen = False
+
+    def freeze(self, frozen: bool = True):
+        """
+        Stop (or resume) checking the posts folder for changes.
+        Useful when the content is known not to change, e.g. during build.
+        The folder is still checked once more on the next refresh, since it
+        may have changed since it was last checked.
+        """
+        with self._lock:
+            self._frozen = frozen
+            if frozen:
+                self._loaded = False
+
+    def invalidate(self, filename: Optional[str] = None):
+        """
+        Drop everything if no filename is given. Otherwise mark the entry as
+        dirty, it's reloaded on next refresh even if the index is frozen.
+        """
+        with self._lock:
+            if filename is None:
+                self._stats.clear()
+                self._entries.clear()
+                self._dirty.clear()
+                self._loaded = False
+            else:
+                self._dirty.add(filename)
+
+    def refresh(self, scope: Any = None):
+        """
+        Bring the index up to date with the posts folder.
+        The scope is anything the loaded entries depend on besides the files
+        themselves (e.g. the URL root), a different scope drops all entries.
+        """
+        with self._lock:
+            if scope != self._scope:
+                self.invalidate()
+                self._scope = scope
+            changed = False
+            if not self._loaded or not self._frozen:
+                changed = self._scan()
+            dirty, self._dirty = self._dirty, set()
+            for filename in dirty:
+                changed = self._reload(filename) or changed
+            if changed or not self._loaded:
+                self._rebuild()
+            self._loaded = True
+
+    def _scan(self) -> bool:
+        changed = False
+        seen = set()
+        try:
+            it = os.scandir(self.folder)
+        except FileNotFoundError:
+            it = None
+        if it is not None:
+            with it:
+                for item in it:
+                    if not item.name.endswith(".md") or not item.is_file():
+                        continue
+                    st = item.stat()
+                    stat = (st.st_mtime_ns, st.st_size)
+                    seen.add(item.name)
+                    if self._stats.get(item.name) != stat:
+                        self._stats[item.name] = stat
+                        self._entries[item.name] = self.loader(item.name)
+                        self._dirty.discard(item.name)
+                        changed = True
+        for filename in set(self._entries) - seen:
+            del self._entries[filename]
+            del self._stats[filename]
+            changed = True
+        return changed
+
+    def _reload(self, filename: str) -> bool:
+        try:
+            st = (self.folder / filename).stat()
+        except FileNotFoundError:
+            self._stats.pop(filename, None)
+            return self._entries.pop(filename, None) is not None
+        self._stats[filename] = (st.st_mtime_ns, st.st_size)
+        self._entries[filename] = self.loader(filename)
+        return True
+
+    def _rebuild(self):
+        posts = [p for _, p in sorted(self._entries.items()) if p and not p.get("hide", False)]
+        posts.sort(key=lambda x: x.get("created", None), reverse=True)
+        categories: dict[str, list[Entry]] = {}
+        tags: dict[str, list[Entry]] = {}
+        archives: dict[tuple[int, ...], list[Entry]] = {}
+        for p in posts:
+            for c in p.get("categories", []):
+                categories.setdefault(c, []).append(p)
+            for t in p.get("tags", []):
+                tags.setdefault(t, []).append(p)
+            created = p.get("created")
+            if created is not None:
+                archives.setdefault((created.year,), []).append(p)
+                archives.setdefault((created.year, created.month), []).append(p)
+        # swap in the new structures at once, readers never see partial state
+        self._posts, self._categories, self._tags, self._archives = posts, categories, tags, archives
+
+    def find(self, filename: str) -> Optional[Entry]:
+        """The loaded entry of the post file, including hidden posts."""
+        return self._entries.get(filename)
+
+    def stat(self, filename: str) -> Optional[tuple[int, int]]:
+        """The (mtime, size) of the post file when it was last loaded."""
+        return self._stats.get(filename)
+
+    def posts(self, scope: Any = None) -> list[Entry]:
+        self.refresh(scope)
+        return self._posts
+
+    def categories(self, scope: Any = None) -> dict[str, list[Entry]]:
+        self.refresh(scope)
+        return self._categories
+
+    def tags(self, scope: Any = None) -> dict[str, list[Entry]]:
+        self.refresh(scope)
+        return self._tags
+
+    def archives(self, scope: Any = None) -> dict[tuple[int, ...], list[Entry]]:
+        """Posts of each (year,) and (year, month), newest first."""
+        self.refresh(scope)
+        return self._archives
+
+
+def taxonomy_terms(buckets: dict[str, list[Entry]], levels: int = 5) -> list[dict[str, Any]]:
+    """
+    The terms (categories or tags) of an index sorted by name, each with its
+    number of posts and a weight from 1 to levels for tag clouds, on a log
+    scale of the numbers so that a few popular terms don't flatten the rest.
+    """
+    if not buckets:
+        return []
+    counts = {name: len(posts) for name, posts in buckets.items()}
+    low, high = math.log(min(counts.values())), math.log(max(counts.values()))
+    terms = []
+    for name in sorted(counts):
+        count = counts[name]
+        weight = 1 + round((levels - 1) * (math.log(count) - low) / (high - low)) if high > low else 1
+        terms.append({"name": name, "count": count, "weight": weight})
+    return terms
@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+from datetime import tzinfo, datetime
+from typing import Any, Mapping, Callable, Iterable, Optional
+
+FEED_CONTENT_TYPES = {
+    "rss": "application/rss+xml",
+    "atom": "application/atom+xml",
+}
+
+
+def generate_feed(
+    kind: str,
+    entries: Iterable[Mapping[str, Any]],
+    *,
+    site: dict[str, Any],
+    root_url: str,
+    home_url: str,
+    self_url: str,
+    tz: tzinfo,
+    title: Optional[str] = None,
+    follow_challenge: Optional[tuple[str, str]] = None,
+) -> bytes:
+    """
+    Generate a RSS or Atom (depending on kind) feed document of the entries.
+    The entries must have `url`, `title`, `content` and `created` fields.
+    """
+    # feedgen and lxml take a while to import, only do it when a feed is generated
+    from lxml import etree
+    from feedgen.util import xml_elem
+    from feedgen.feed import FeedGenerator
+
+    feed_gen = FeedGenerator()
+    feed_gen.id(home_url)
+    feed_gen.title(title or site.get("title", ""))
+    feed_gen.subtitle(site.get("subtitle", ""))
+    if "author" in site:
+        feed_gen.author(name=site["author"])
+    feed_gen.link(href=home_url, rel="alternate")
+    feed_gen.link(href=self_url, rel="self")
+    last_updated: Optional[datetime] = None
+    for p in entries:
+        updated = p.get("updated", p["created"]).replace(tzinfo=tz)
+        feed_entry = feed_gen.add_entry()
+        feed_entry.id(root_url + p["url"])
+        feed_entry.link(href=root_url + p["url"])
+        feed_entry.title(p["title"])
+        feed_entry.content(p["content"], type="CDATA" if kind == "rss" else "html")
+        feed_entry.published(p["created"].replace(tzinfo=tz))
+        feed_entry.updated(updated)
+        if "author" in p:
+            feed_entry.author(name=p["author"])
+        last_updated = updated if last_updated is None else max(last_updated, updated)
+    if last_updated is not None:
+        # derive the update time from the entries, so the document only changes with them
+        feed_gen.updated(last_updated)
+        feed_gen.lastBuildDate(last_updated)
+    # generate the feed
+    if kind == "atom":
+        _, doc = feed_gen._create_atom(extensions=True)
+    else:
+        _, doc = feed_gen._create_rss(extensions=True)
+        if follow_challenge:
+            # add the custom element
+            root = doc.getroot()
+            channel = root.find("channel")
+            challenge = xml_elem("follow_challenge", channel)
+            feed_id = xml_elem("feedId", challenge)
+            feed_id.text = follow_challenge[0]
+            user_id = xml_elem("userId", challenge)
+            user_id.text = follow_challenge[1]
+    # convert back to a string
+    return etree.tostring(doc, pretty_print=True, encoding="UTF-8", xml_declaration=True)  # type: ignore
+
+
+class FeedCache:
+    """
+    In-memory LRU cache of serialized feed documents.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._docs: OrderedDict[str, bytes] = OrderedDict()
+
+    def get_or_generate(self, key: str, generate: Callable[[], bytes]) -> bytes:
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None:
+                self._docs.move_to_end(key)
+                return doc
+        doc = generate()
+        with self._lock:
+            self._docs[key] = doc
+            while len(self._docs) > self.max_entries:
+                self._docs.popitem(last=False)
+        return doc
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
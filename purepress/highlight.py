@@ -0,0 +1,35 @@
+import functools
+from typing import Any, Optional
+from types import SimpleNamespace
+from importlib.util import find_spec
+
+has_pygments = find_spec("pygments") is not None
+
+
+@functools.lru_cache(maxsize=None)
+def _codehilite_conf() -> dict[str, Any]:
+    # options of code highlighting, the same as the fenced code blocks of gfm
+    from gfm import StandaloneFencedCodeExtension
+
+    return StandaloneFencedCodeExtension().getConfigs()
+
+
+@functools.lru_cache(maxsize=4096)
+def highlight_fenced_block(block: str, use_pygments: bool) -> Optional[str]:
+    """
+    Convert a fenced code block (including the fences) to html, highlighted
+    with Pygments if use_pygments. Identical blocks across documents are
+    converted only once.
+    Returns None if the block is not a valid fenced code block.
+    """
+    from markdown.util import HtmlStash
+    from markdown.extensions.fenced_code import FencedBlockPreprocessor
+
+    # run the very preprocessor of gfm on the single block, so the html is the same
+    md = SimpleNamespace(htmlStash=HtmlStash(), registeredExtensions=[])
+    processor = FencedBlockPreprocessor(md, {})  # type: ignore
+    processor.checked_for_deps = True
+    processor.codehilite_conf = dict(_codehilite_conf(), use_pygments=use_pygments)
+    processor.run(block.split("\n"))
+    blocks = md.htmlStash.rawHtmlBlocks
+    return blocks[0] if blocks else None
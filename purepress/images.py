@@ -0,0 +1,161 @@
+"""
+Responsive images: resized derivatives of local images at configured widths.
+
+Derivatives are named by the content hash of their source and their width,
+e.g. 0123456789abcdef-960.webp, and cached on disk, so only new or changed
+images are ever resized, and the files can be cached forever by browsers.
+"""
+
+import os
+import re
+import time
+import hashlib
+import tempfile
+import functools
+import threading
+from pathlib import Path
+from importlib.util import find_spec
+from typing import Optional, NamedTuple
+
+has_pillow = find_spec("PIL") is not None
+
+# formats of derivatives, as {format: (file extension, mimetype)}
+FORMATS = {"webp": ("webp", "image/webp"), "avif": ("avif", "image/avif"), "jpeg": ("jpg", "image/jpeg")}
+
+# source images that can be resized, animated gifs and svgs are left alone
+SOURCE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+_derivative_name_exp = re.compile(r"^([0-9a-f]{16})-([1-9][0-9]*)\.([a-z]+)$")
+
+# EXIF orientations that swap the width and height
+_transposed_orientations = {5, 6, 7, 8}
+
+
+class ImageInfo(NamedTuple):
+    path: Path
+    digest: str
+    width: int
+    height: int
+
+
+@functools.lru_cache(maxsize=4096)
+def _image_info(path: str, mtime_ns: int, size: int) -> Optional[ImageInfo]:
+    from PIL import Image
+
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    try:
+        with Image.open(path) as im:
+            width, height = im.size
+            if im.getexif().get(0x0112) in _transposed_orientations:
+                width, height = height, width
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return ImageInfo(Path(path), digest, width, height)
+
+
+# sources of the derivatives, as {digest: source path}, filled by image_info
+_sources: dict[str, Path] = {}
+# when a folder was last scanned for sources, see find_source
+_scan_lock = threading.Lock()
+_last_scans: dict[Path, float] = {}
+SCAN_INTERVAL = 1.0
+
+
+def image_info(path: Path) -> Optional[ImageInfo]:
+    """
+    The content hash and intrinsic (displayed) size of an image, read again
+    only if its (mtime, size) changed. Returns None if it can't be resized.
+    """
+    if not has_pillow or path.suffix.lower() not in SOURCE_SUFFIXES:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    info = _image_info(os.fspath(path), st.st_mtime_ns, st.st_size)
+    if info is not None:
+        _sources[info.digest] = info.path
+    return info
+
+
+def derivative_widths(info: ImageInfo, widths: list[int], fmt: str) -> list[int]:
+    """
+    The widths to resize an image to, images are never upscaled. Except for
+    JPEG, a copy in full size is included, since the original can't be in
+    the same srcset as the derivatives.
+    """
+    result = {w for w in widths if 0 < w < info.width}
+    if fmt != "jpeg":
+        result.add(info.width)
+    return sorted(result)
+
+
+def derivative_name(info: ImageInfo, width: int, fmt: str) -> str:
+    return f"{info.digest}-{width}.{FORMATS[fmt][0]}"
+
+
+def parse_derivative_name(name: str) -> Optional[tuple[str, int, str]]:
+    """The source digest, width and format of a derivative."""
+    m = _derivative_name_exp.match(name)
+    if not m:
+        return None
+    digest, width, ext = m.group(1), int(m.group(2)), m.group(3)
+    fmt = next((fmt for fmt, (fmt_ext, _) in FORMATS.items() if fmt_ext == ext), None)
+    if fmt is None:
+        return None
+    return digest, width, fmt
+
+
+def find_source(digest: str, folder: Path) -> Optional[Path]:
+    """
+    The source image in folder with the digest. Sources are known once their
+    info is read, e.g. when rendering a page using them, and looked for in
+    folder otherwise (at most once per SCAN_INTERVAL), e.g. in a new process.
+    """
+    source = _sources.get(digest)
+    if source is not None:
+        info = image_info(source)
+        if info is not None and info.digest == digest:
+            return source
+    with _scan_lock:
+        now = time.monotonic()
+        if now - _last_scans.get(folder, -SCAN_INTERVAL) < SCAN_INTERVAL:
+            return None
+        _last_scans[folder] = now
+    # image info is cached by (mtime, size), so only new or changed images are read
+    for dirname, _, files in os.walk(folder):
+        for file in files:
+            info = image_info(Path(dirname) / file)
+            if info is not None and info.digest == digest:
+                return info.path
+    return None
+
+
+def make_derivative(src_path: Path, dst_path: Path, width: int, fmt: str, *, quality: int = 80) -> Path:
+    """
+    Resize the image at src_path to width, in format fmt, into dst_path,
+    unless it already exists. Returns dst_path.
+    """
+    if dst_path.is_file():
+        return dst_path
+    from PIL import Image, ImageOps
+
+    with Image.open(src_path) as im:
+        im = ImageOps.exif_transpose(im)
+        height = max(1, round(im.height * width / im.width))
+        if fmt == "jpeg":
+            im = im.convert("RGB")
+        elif im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "transparency" in im.info or im.mode in ("LA", "PA") else "RGB")
+        im = im.resize((width, height), Image.Resampling.LANCZOS)
+        dst_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dst_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                im.save(f, format=fmt.upper(), quality=quality)
+            os.replace(tmp, dst_path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    return dst_path
@@ -0,0 +1,62 @@
+import re
+from typing import Callable, Optional
+
+# /<kind>/<path><query or fragment>
+_source_path_exp = re.compile(r"^/(posts|pages|raw)/([^?#]*)(.*)$", flags=re.DOTALL)
+
+
+class LinkResolver:
+    """
+    Rewrite links to source files into urls of the site, e.g.
+
+        /posts/2021-08-23-hello-world.md -> /post/2021/08/23/hello-world/
+        /pages/about/ -> /about/
+        /pages/about/index.md -> /about/
+        /pages/foo/bar.md -> /foo/bar.html
+        /raw/foo/baz.html -> /foo/baz.html
+        /static/foo.png -> <static url>/foo.png
+
+    The url root and static url are computed once for an app configuration,
+    and `exists(kind, path)` is asked whether the target of a link exists.
+    """
+
+    def __init__(self, root: str, static_url: str, exists: Optional[Callable[[str, str], bool]] = None):
+        self.root = root.rstrip("/")
+        self.static_url = static_url
+        self.exists = exists
+
+    @staticmethod
+    def is_source_link(href: str) -> bool:
+        return _source_path_exp.match(href) is not None
+
+    def is_broken(self, href: str) -> bool:
+        """Whether href links to a source file that doesn't exist."""
+        m = _source_path_exp.match(href)
+        if not m or self.exists is None:
+            return False
+        kind, path, _ = m.groups()
+        return not self.exists(kind, path)
+
+    def resolve(self, href: str) -> str:
+        m = _source_path_exp.match(href)
+        if not m:
+            return href
+        kind, path, suffix = m.groups()
+        if kind == "posts":
+            url = f"{self.root}/post/" + path.replace("-", "/", 3)
+            if url.endswith(".md"):
+                url = url[:-3] + "/"
+        elif kind == "pages":
+            url = f"{self.root}/{path}"
+            if path == "index.md" or path.endswith("/index.md"):
+                url = url[:-8]
+            elif url.endswith(".md"):
+                url = url[:-3] + ".html"
+        else:
+            url = f"{self.root}/{path}"
+        return url + suffix
+
+    def resolve_static(self, src: str) -> str:
+        if src.startswith("/static/"):
+            return self.static_url + src[len("/static/") :]
+        return src
@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from .cache import hash_key
+
+
+class BuildManifest:
+    """
+    Records every output of a build together with the sources it was made
+    from and a signature of all its inputs.
+
+    The next build compares the signatures to find outputs that are still
+    fresh, and removes outputs that are no longer produced.
+
+    The links to source files in each source are kept too, so that every
+    build checks all of them, including those in sources not rendered again.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: Path, root: Path, build_folder: Path, previous: Optional[dict[str, Any]] = None):
+        self.path = path
+        self.root = root
+        self.build_folder = build_folder
+        previous = previous or {}
+        if previous.get("version") != self.VERSION:
+            previous = {}
+        self._prev_outputs: dict[str, Any] = previous.get("outputs", {})
+        self._prev_hashes: dict[str, Any] = previous.get("hashes", {})
+        self._prev_links: dict[str, list[str]] = previous.get("links", {})
+        self.outputs: dict[str, Any] = {}
+        self.hashes: dict[str, Any] = {}
+        self.links: dict[str, list[str]] = {}
+        self.config_hash = ""
+        self.templates_hash = ""
+
+    @classmethod
+    def load(cls, path: Path, root: Path, build_folder: Path) -> "BuildManifest":
+        try:
+            with open(path, encoding="utf-8") as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+        return cls(path, root, build_folder, previous)
+
+    @property
+    def has_previous(self) -> bool:
+        return bool(self._prev_outputs)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": self.VERSION,
+            "config": self.config_hash,
+            "templates": self.templates_hash,
+            "hashes": self.hashes,
+            "outputs": self.outputs,
+            "links": self.source_links(),
+        }
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def file_hash(self, path: Path) -> str:
+        """Hash of file content, reused from the previous build if (mtime, size) didn't change."""
+        key = self._src(path)
+        try:
+            st = path.stat()
+        except OSError:
+            return ""
+        stat = [st.st_mtime_ns, st.st_size]
+        prev = self.hashes.get(key) or self._prev_hashes.get(key)
+        if prev and prev[:2] == stat:
+            digest = prev[2]
+        else:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        self.hashes[key] = stat + [digest]
+        return digest
+
+    def folder_hash(self, folder: Path) -> str:
+        """Hash of all files in a folder, e.g. the templates."""
+        files = sorted(p for p in folder.rglob("*") if p.is_file()) if folder.is_dir() else []
+        return hash_key([(p.relative_to(folder).as_posix(), self.file_hash(p)) for p in files])
+
+    def signature(self, sources: Iterable[Path], *extra: Any, with_globals: bool = True) -> str:
+        parts: list[Any] = [self.file_hash(p) for p in sources]
+        if with_globals:
+            parts += [self.config_hash, self.templates_hash]
+        return hash_key(parts, extra)
+
+    def is_fresh(self, output: Path, signature: str) -> bool:
+        prev = self._prev_outputs.get(self._rel(output))
+        return bool(prev) and prev["signature"] == signature and output.is_file()
+
+    def record(self, output: Path, sources: Iterable[Path], signature: str):
+        self.outputs[self._rel(output)] = {
+            "sources": sorted(self._src(p) for p in sources),
+            "signature": signature,
+        }
+
+    def record_links(self, source: str, links: Iterable[str]):
+        """Record the links to source files in a source rendered by this build."""
+        self.links[source] = sorted(set(links))
+
+    def source_links(self) -> dict[str, list[str]]:
+        """
+        Links in the sources of all outputs of this build, as recorded by this
+        build or, for sources not rendered again, by the previous one.
+        """
+        sources = {src for output in self.outputs.values() for src in output["sources"]}
+        links = {}
+        for src in sorted(sources):
+            src_links = self.links.get(src, self._prev_links.get(src))
+            if src_links:
+                links[src] = src_links
+        return links
+
+    def stale_outputs(self) -> list[Path]:
+        """Files in the build folder that were not produced by this build."""
+        stale = []
+        for dirname, _, files in os.walk(self.build_folder):
+            for file in files:
+                path = Path(dirname) / file
+                if self._rel(path) not in self.outputs:
+                    stale.append(path)
+        return sorted(stale)
+
+    def _rel(self, output: Path) -> str:
+        return output.relative_to(self.build_folder).as_posix()
+
+    def _src(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
@@ -0,0 +1,260 @@
+"""
+The markdown pipeline: GFM plus the hooks of purepress, which resolve links
+to source files and static files, highlight code and resize images.
+
+Importing markdown, its extensions and Pygments takes a while, so this
+module is only imported on the first conversion (see `_markdown_convert`).
+"""
+
+import re
+import queue
+from xml.etree import ElementTree
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+import markdown.extensions
+from flask import url_for
+import markdown.treeprocessors
+from markdown import Markdown, util
+from markdown.preprocessors import Preprocessor
+from mdx_gfm import GithubFlavoredMarkdownExtension
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+
+from . import images
+from .profiling import span
+from .toc import HeadingIds, anchor_html
+from .highlight import highlight_fenced_block
+from .application import link_resolver, image_settings, static_image_info, server_highlighting
+
+
+class HighlightCodePreprocessor(Preprocessor):
+    """
+    Replace fenced code blocks with their html, before the fenced code
+    preprocessor of gfm sees them, using the memoized highlight_fenced_block.
+    """
+
+    def __init__(self, md: Markdown, use_pygments: Callable[[], bool]):
+        super().__init__(md)
+        self.use_pygments = use_pygments
+
+    def run(self, lines: list[str]) -> list[str]:
+        use_pygments = self.use_pygments()
+
+        def replace(m) -> str:
+            html = highlight_fenced_block(m.group(0), use_pygments)
+            if html is None:
+                return m.group(0)
+            return f"\n{self.md.htmlStash.store(html)}\n"
+
+        text = FencedBlockPreprocessor.FENCED_BLOCK_RE.sub(replace, "\n".join(lines))
+        return text.split("\n")
+
+
+class HookImageSrcProcessor(markdown.treeprocessors.Treeprocessor):
+    def run(self, root: ElementTree.Element):
+        resolver = link_resolver()
+        for el in root.iter("img"):
+            src = el.get("src", "")
+            if src.startswith("/static/"):
+                el.set("src", resolver.resolve_static(src))
+
+
+class ResponsiveImageProcessor(markdown.treeprocessors.Treeprocessor):
+    """
+    Give images in the static folder their intrinsic size, lazy loading and
+    a srcset of their resized derivatives. Images in modern formats are
+    wrapped in <picture>, so that browsers without support fall back to the
+    original image.
+    """
+
+    def run(self, root: ElementTree.Element):
+        settings = image_settings()
+        if settings is None:
+            return
+        fmt = settings["format"]
+        used_images = getattr(self.md, "images", None)
+        for el in list(root.iter("img")):
+            src = el.get("src", "")
+            info = static_image_info(src)
+            if info is None:
+                continue
+            if used_images is not None:
+                used_images.append([src, info.digest])
+            srcset = [
+                f"{url_for('image_derivative', filename=images.derivative_name(info, w, fmt))} {w}w"
+                for w in images.derivative_widths(info, settings["widths"], fmt)
+            ]
+            if el.get("width") is None and el.get("height") is None:
+                el.set("width", str(info.width))
+                el.set("height", str(info.height))
+            el.set("loading", el.get("loading", "lazy"))
+            el.set("decoding", "async")
+            if fmt == "jpeg":
+                srcset.append(f"{link_resolver().resolve_static(src)} {info.width}w")
+                el.set("srcset", ", ".join(srcset))
+                el.set("sizes", settings["sizes"])
+                continue
+            # turn the <img> into <picture><source><img></picture> in place
+            img = ElementTree.Element("img", dict(el.attrib))
+            tail = el.tail
+            el.clear()
+            el.tag, el.tail = "picture", tail
+            mimetype = images.FORMATS[fmt][1]
+            ElementTree.SubElement(
+                el, "source", {"type": mimetype, "srcset": ", ".join(srcset), "sizes": settings["sizes"]}
+            )
+            el.append(img)
+
+
+class HookLinkHrefProcessor(markdown.treeprocessors.Treeprocessor):
+    @staticmethod
+    def path_to_url(path: str) -> str:
+        return link_resolver().resolve(path)
+
+    def run(self, root: ElementTree.Element):
+        resolver = link_resolver()
+        source_links = getattr(self.md, "source_links", None)
+        for el in root.iter("a"):
+            href = el.get("href", "")
+            if href.startswith("/"):
+                el.set("href", resolver.resolve(href))
+                if source_links is not None and resolver.is_source_link(href):
+                    source_links.append(href)
+
+
+_heading_levels = {f"h{level}": level for level in range(1, 7)}
+# tags in the text of headings, which come from raw html
+_tag_exp = re.compile(r"<(?!!--)[^>]*>")
+# headings in raw html blocks
+_raw_heading_exp = re.compile(r"(<h([1-6])(?:\s[^>]*)?>)(.*?)(</h\2\s*>)", re.IGNORECASE | re.DOTALL)
+# a paragraph standing for a raw html block
+_raw_block_exp = re.compile(rf"^{util.HTML_PLACEHOLDER_RE.pattern}$")
+# "&" not starting an entity
+_amp_exp = re.compile(r"&(?!(?:\#[0-9]+|\#x[0-9a-f]+|[0-9a-z]+);)")
+
+
+def _escape_text(text: str) -> str:
+    """Escape text as the markdown serializer does, keeping entities."""
+    return _amp_exp.sub("&amp;", text).replace("<", "&lt;").replace(">", "&gt;")
+
+
+class HeadingAnchorProcessor(markdown.treeprocessors.Treeprocessor):
+    """
+    Give headings ids and anchors, and collect them for the table of contents
+    into `md.headings` (if it's a list), the same as html_toc does on the html.
+    Headings written in raw html blocks get them too. Runs after unescaping,
+    when headings are final.
+    """
+
+    def postprocess(self, html: str) -> str:
+        # bring back raw html and other placeholders, as in the final html
+        for pp in self.md.postprocessors:
+            html = pp.run(html)
+        return html
+
+    def run(self, root: ElementTree.Element):
+        headings = getattr(self.md, "headings", None)
+        if headings is None:
+            return
+        ids = HeadingIds()
+        for el in list(root.iter()):
+            level = _heading_levels.get(el.tag)
+            if level is None:
+                if el.tag == "p" and el.text and not len(el):
+                    m = _raw_block_exp.match(el.text)
+                    if m:
+                        self.run_raw(int(m.group(1)), ids, headings)
+                continue
+            inner = ElementTree.Element("div")
+            inner.text = el.text
+            inner.extend(el)
+            inner_html = self.postprocess(self.md.serializer(inner)[len("<div>") : -len("</div>")])
+            # the text is taken from the html, entities included
+            text = self.postprocess("".join(_escape_text(t) for t in inner.itertext()))
+            if "<" in text:
+                text = _tag_exp.sub("", text)
+            heading_id = ids.make(text)
+            # stashed as raw html, so the attributes are kept in this order
+            anchor = self.md.htmlStash.store(anchor_html(heading_id))
+            el.text = anchor + (el.text or "")
+            headings.append({"level": level, "id": heading_id, "text": text, "inner_html": inner_html})
+
+    def run_raw(self, index: int, ids: HeadingIds, headings: list[dict[str, Any]]):
+        blocks = self.md.htmlStash.rawHtmlBlocks
+        if not isinstance(blocks[index], str):
+            return
+
+        def replace(m) -> str:
+            start_tag, level, inner_html, end_tag = m.groups()
+            text = _tag_exp.sub("", inner_html)
+            heading_id = ids.make(text)
+            headings.append({"level": int(level), "id": heading_id, "text": text, "inner_html": inner_html})
+            return f"{start_tag}{anchor_html(heading_id)}{inner_html}{end_tag}"
+
+        blocks[index] = _raw_heading_exp.sub(replace, blocks[index])
+
+
+class Extension(markdown.extensions.Extension):
+    def extendMarkdown(self, md) -> None:
+        self.md = md
+        md.registerExtension(self)
+        md.source_links = []
+        md.images = []
+        md.headings = None
+        # right before the fenced code preprocessor of gfm
+        md.preprocessors.register(HighlightCodePreprocessor(md, server_highlighting), "highlight-code", 26)
+        # before the static urls are resolved
+        md.treeprocessors.register(ResponsiveImageProcessor(md), "responsive-image", 6)
+        md.treeprocessors.register(HookImageSrcProcessor(md), "hook-image-src", 5)
+        md.treeprocessors.register(HookLinkHrefProcessor(md), "hook-link-href", 5)
+        # after unescaping (priority 0)
+        md.treeprocessors.register(HeadingAnchorProcessor(md), "heading-anchor", -1)
+
+    def reset(self) -> None:
+        self.md.source_links = []
+        self.md.images = []
+        self.md.headings = None
+
+
+class MarkdownPool:
+    """
+    Pool of preconfigured Markdown instances, which are not thread-safe.
+    Each conversion checks out an idle instance (or creates a new one), so
+    concurrent requests never share an instance.
+    """
+
+    def __init__(self, factory: Callable[[], Markdown]):
+        self._factory = factory
+        self._idle: queue.SimpleQueue[Markdown] = queue.SimpleQueue()
+
+    @contextmanager
+    def checkout(self) -> Iterator[Markdown]:
+        try:
+            md = self._idle.get_nowait()
+        except queue.Empty:
+            md = self._factory()
+        try:
+            md.reset()
+            yield md
+        finally:
+            self._idle.put(md)
+
+
+md_pool = MarkdownPool(lambda: Markdown(extensions=[GithubFlavoredMarkdownExtension(), Extension(), "footnotes"]))
+
+
+def convert(text: str, *, parse_toc: bool = False) -> dict[str, Any]:
+    """
+    Convert markdown to html. Returns the html as `content`, along with the
+    links to source files (`source_links`), the resized images as [src, digest]
+    pairs (`images`) and the headings if parse_toc (`headings`, see toc.py).
+    """
+    with span("markdown"), md_pool.checkout() as md:
+        md.headings = [] if parse_toc else None
+        html = md.convert(text)
+        return {
+            "content": html,
+            "source_links": list(md.source_links),
+            "images": list(md.images),
+            "headings": md.headings or [],
+        }
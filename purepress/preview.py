@@ -0,0 +1,217 @@
+import os
+import time
+import threading
+from pathlib import Path
+from typing import Callable, Iterator
+
+import toml
+from flask import Flask, Response, url_for
+
+from . import (
+    app,
+    site,
+    config,
+    post_index,
+    root_folder,
+    pages_folder,
+    posts_folder,
+    template_folder,
+    resolved_templates,
+    theme_static_folder,
+)
+
+LIVE_RELOAD_SCRIPT = """\
+<script>
+  new EventSource("{url}").addEventListener("reload", () => location.reload());
+</script>
+"""
+
+
+class FileWatcher:
+    """
+    Watch files and folders (recursively) for changes, and call on_change with
+    the set of changed paths. Uses watchdog (inotify on Linux) if it's installed,
+    and falls back to polling the (mtime, size) of every file otherwise.
+    """
+
+    def __init__(self, paths: list[Path], on_change: Callable[[set[Path]], None], *, interval: float = 0.5):
+        self.paths = paths
+        self.on_change = on_change
+        self.interval = interval
+        self._changed: set[Path] = set()
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._stopped = False
+        self._observer = None
+        self._thread = threading.Thread(target=self._run, name="purepress-watcher", daemon=True)
+
+    @property
+    def backend(self) -> str:
+        return "polling" if self._observer is None else "watchdog"
+
+    def start(self):
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            pass
+        else:
+            watcher = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    if event.event_type in ("opened", "closed_no_write"):
+                        return
+                    for path in (event.src_path, getattr(event, "dest_path", "")):
+                        if path:
+                            watcher._add(Path(os.fsdecode(path)))
+
+            self._observer = Observer()
+            for path in self.paths:
+                if path.is_dir():
+                    self._observer.schedule(Handler(), path.as_posix(), recursive=True)
+                elif path.parent.is_dir():
+                    self._observer.schedule(Handler(), path.parent.as_posix(), recursive=False)
+            self._observer.start()
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._event.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    def _add(self, path: Path):
+        if any(path == p or p in path.parents for p in self.paths):
+            with self._lock:
+                self._changed.add(path)
+            self._event.set()
+
+    def _snapshot(self) -> dict[Path, tuple[int, int]]:
+        snapshot = {}
+        for path in self.paths:
+            files = [path] if path.is_file() else path.rglob("*")
+            for file in files:
+                try:
+                    st = file.stat()
+                except OSError:
+                    continue
+                if not file.is_dir():
+                    snapshot[file] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def _run(self):
+        snapshot = self._snapshot() if self._observer is None else {}
+        while not self._stopped:
+            if self._observer is None:
+                time.sleep(self.interval)
+                current = self._snapshot()
+                keys = snapshot.keys() | current.keys()
+                changed = {p for p in keys if snapshot.get(p) != current.get(p)}
+                snapshot = current
+            else:
+                self._event.wait()
+                time.sleep(0.05)  # wait a little, to batch the events of one save
+                self._event.clear()
+                with self._lock:
+                    changed, self._changed = self._changed, set()
+            if changed and not self._stopped:
+                self.on_change(changed)
+
+
+class ReloadBroker:
+    """
+    Broadcast reload events to the connected pages over server-sent events.
+    """
+
+    def __init__(self, *, heartbeat: float = 15):
+        self.heartbeat = heartbeat
+        self._cond = threading.Condition()
+        self._version = 0
+
+    def notify(self):
+        with self._cond:
+            self._version += 1
+            self._cond.notify_all()
+
+    def stream(self) -> Iterator[str]:
+        version = self._version
+        yield "retry: 1000\n\n"
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._version != version, timeout=self.heartbeat)
+                changed, version = self._version != version, self._version
+            # heartbeat comments let the server notice disconnected clients
+            yield "event: reload\ndata: reload\n\n" if changed else ": ping\n\n"
+
+
+def invalidate(paths: set[Path], *, flask_app: Flask = app):
+    """
+    Invalidate what is cached for the changed paths: post index entries,
+    compiled templates and configurations. Rendered markdown is cached by
+    content, so it never goes stale.
+    """
+    for path in paths:
+        if path.parent == posts_folder and path.suffix == ".md":
+            post_index.invalidate(path.name)
+        elif template_folder in path.parents:
+            name = path.relative_to(template_folder).as_posix()
+            # a custom template may have been added or removed
+            resolved_templates.clear()
+            cache = flask_app.jinja_env.cache
+            if cache is not None:
+                for key in list(cache.keys()):
+                    if key[1] == name:
+                        del cache[key]
+        elif path == root_folder / "purepress.toml":
+            try:
+                purepress_config = toml.load(path)
+            except (OSError, toml.TomlDecodeError):
+                continue
+            # update in place, everything else holds references to them
+            site.clear()
+            site.update(purepress_config.get("site", {}))
+            config.clear()
+            config.update(purepress_config.get("config", {}))
+            post_index.invalidate()
+
+
+def enable_live_reload(watch_paths: list[Path], *, flask_app: Flask = app) -> FileWatcher:
+    """
+    Watch the instance for changes, invalidate affected caches and tell
+    the opened pages to reload.
+    """
+    broker = ReloadBroker()
+
+    def on_change(paths: set[Path]):
+        invalidate(paths, flask_app=flask_app)
+        broker.notify()
+
+    @flask_app.route("/__purepress__/live-reload")
+    def live_reload():
+        res = Response(broker.stream(), mimetype="text/event-stream")
+        res.headers["Cache-Control"] = "no-cache"
+        res.headers["X-Accel-Buffering"] = "no"
+        return res
+
+    @flask_app.after_request
+    def inject_live_reload_script(res: Response) -> Response:
+        if res.mimetype != "text/html" or res.direct_passthrough or res.is_streamed:
+            return res
+        data = res.get_data(as_text=True)
+        script = LIVE_RELOAD_SCRIPT.format(url=url_for("live_reload"))
+        i = data.rfind("</body>")
+        res.set_data(data[:i] + script + data[i:] if i >= 0 else data + script)
+        return res
+
+    # the watcher tells what changed, no need to check files on every request
+    post_index.freeze()
+    flask_app.config["TEMPLATES_AUTO_RELOAD"] = False
+    flask_app.jinja_env.auto_reload = False
+    watcher = FileWatcher(watch_paths, on_change)
+    watcher.start()
+    return watcher
+
+
+def default_watch_paths() -> list[Path]:
+    return [posts_folder, pages_folder, template_folder, theme_static_folder, root_folder / "purepress.toml"]
@@ -0,0 +1,147 @@
+"""
+A lightweight profiler of the hot paths of rendering.
+
+Hot paths are wrapped in `span(name, cat)`, which does nothing but return
+a shared null context unless profiling is enabled, so it costs next to
+nothing by default. Spans are recorded as Chrome trace events, which can
+be loaded in chrome://tracing or https://ui.perfetto.dev.
+
+Spans of category "page" collect the time of the "phase" spans nested in
+them, so that every rendered url gets its own breakdown.
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Any, Iterator, Optional
+from contextlib import nullcontext, contextmanager
+
+# what span returns when disabled, the args written to it are simply ignored
+_null_span = nullcontext({})
+
+
+class Profiler:
+    def __init__(self):
+        self.events: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args) -> Iterator[dict[str, Any]]:
+        """
+        Record the wall time of the block. The yielded args can be updated
+        by the block, e.g. with the number of bytes written.
+        """
+        page = cat == "page"
+        if page:
+            parent_phases = getattr(self._local, "phases", None)
+            self._local.phases = args["phases"] = {}
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        finally:
+            dur = time.perf_counter_ns() - start
+            if page:
+                self._local.phases = parent_phases
+            elif cat == "phase":
+                phases = getattr(self._local, "phases", None)
+                if phases is not None:
+                    phases[name] = phases.get(name, 0) + dur / 1e9
+            event = {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": start / 1e3,
+                "dur": dur / 1e3,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def drain(self) -> list[dict[str, Any]]:
+        """Take the recorded events, e.g. to send them to another process."""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def extend(self, events: list[dict[str, Any]]):
+        with self._lock:
+            self.events.extend(events)
+
+
+_profiler: Optional[Profiler] = None
+
+
+def enable() -> Profiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def active() -> Optional[Profiler]:
+    return _profiler
+
+
+def span(name: str, cat: str = "phase", **args):
+    if _profiler is None:
+        return _null_span
+    return _profiler.span(name, cat, **args)
+
+
+def summarize(events: list[dict[str, Any]], *, top: Optional[int] = None) -> dict[str, Any]:
+    """
+    Total (inclusive) time of every phase and step, and the pages, slowest
+    first (only the top ones if given), with their time, bytes and phases.
+    """
+    phases: dict[str, dict[str, float]] = {}
+    steps: dict[str, float] = {}
+    pages = []
+    for e in events:
+        seconds = e["dur"] / 1e6
+        if e["cat"] == "phase":
+            phase = phases.setdefault(e["name"], {"count": 0, "total": 0.0, "max": 0.0})
+            phase["count"] += 1
+            phase["total"] += seconds
+            phase["max"] = max(phase["max"], seconds)
+        elif e["cat"] == "step":
+            steps[e["name"]] = steps.get(e["name"], 0.0) + seconds
+        elif e["cat"] == "page":
+            args = e["args"]
+            pages.append(
+                {"url": e["name"], "time": seconds, "bytes": args.get("bytes", 0), "phases": args.get("phases", {})}
+            )
+    pages.sort(key=lambda p: p["time"], reverse=True)
+    return {
+        "steps": steps,
+        "phases": phases,
+        "page_count": len(pages),
+        "page_time": sum(p["time"] for p in pages),
+        "bytes": sum(p["bytes"] for p in pages),
+        "pages": pages[:top] if top is not None else pages,
+    }
+
+
+def format_summary(summary: dict[str, Any]) -> list[str]:
+    lines = [f"Rendered {summary['page_count']} pages in {summary['page_time']:.2f}s, {summary['bytes']} bytes"]
+    lines.append("Phases:")
+    for name, phase in sorted(summary["phases"].items(), key=lambda x: x[1]["total"], reverse=True):
+        lines.append(f"  {name:<10} {phase['total']:8.3f}s  {phase['count']:7d} calls  max {phase['max'] * 1e3:.1f}ms")
+    lines.append("Slowest pages:")
+    for page in summary["pages"]:
+        phases = ", ".join(f"{k} {v * 1e3:.1f}ms" for k, v in sorted(page["phases"].items(), key=lambda x: -x[1]))
+        lines.append(f"  {page['time'] * 1e3:8.1f}ms  {page['bytes']:8d}B  {page['url']}  ({phases})")
+    return lines
+
+
+def write_profile(path: str, events: list[dict[str, Any]], *, fmt: str = "chrome"):
+    """Write the events as a Chrome trace, or the summary of all pages as JSON."""
+    if fmt == "chrome":
+        data: dict[str, Any] = {"traceEvents": events, "displayTimeUnit": "ms"}
+    else:
+        data = summarize(events)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
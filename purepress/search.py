@@ -0,0 +1,105 @@
+"""
+Client-side search index of posts.
+
+Terms are lowercased words for alphabetic scripts, and overlapping bigrams
+for CJK text, which has no spaces between words. The index is split into
+shards by the prefix of terms (see `shard_of`), so the browser only needs
+to download the shards of the terms in a query.
+`theme/static/search.js` implements the same tokenization and queries it.
+"""
+
+import re
+from html.parser import HTMLParser
+from typing import Any, Iterable, Iterator
+
+SEARCH_VERSION = 1
+
+# hiragana, katakana, CJK ideographs and hangul
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_cjk_exp = re.compile(f"[{_CJK}]")
+_token_exp = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+
+# how much an occurrence of a term in each field counts
+FIELD_WEIGHTS = {"title": 10, "taxonomy": 5, "body": 1}
+
+
+def tokenize(text: str) -> Iterator[str]:
+    for m in _token_exp.finditer(text.lower()):
+        token = m.group()
+        if _cjk_exp.match(token):
+            if len(token) == 1:
+                yield token
+            else:
+                yield from (token[i : i + 2] for i in range(len(token) - 1))
+        elif len(token) > 1 or token.isdigit():
+            yield token
+
+
+class _TextParser(HTMLParser):
+    # text of the html, without code blocks, scripts and styles
+    skipped_tags = {"pre", "script", "style"}
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: list[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skipped_tags:
+            self._skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.skipped_tags and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.chunks.append(data)
+
+
+def html_text(html: str) -> str:
+    parser = _TextParser()
+    parser.feed(html)
+    parser.close()
+    return " ".join(parser.chunks)
+
+
+def post_terms(title: str, taxonomy: Iterable[str], content_html: str) -> dict[str, int]:
+    """The weighted term frequencies of a post."""
+    terms: dict[str, int] = {}
+    fields = (("title", title), ("taxonomy", " ".join(taxonomy)), ("body", html_text(content_html)))
+    for field, text in fields:
+        weight = FIELD_WEIGHTS[field]
+        for term in tokenize(text):
+            terms[term] = terms.get(term, 0) + weight
+    return terms
+
+
+def shard_of(term: str) -> str:
+    """
+    The shard a term belongs to: its first character if that is ASCII,
+    or the upper byte of the code point of the first character otherwise.
+    """
+    c = term[0]
+    if c.isascii():
+        return c
+    return f"u{ord(c) >> 8:x}"
+
+
+def build_index(docs: list[dict[str, Any]], doc_terms: list[dict[str, int]]) -> tuple[dict[str, Any], dict[str, Any]]:
+    """
+    Merge the terms of each document into the sharded inverted index.
+    Returns the index manifest and the shards, each mapping its terms to
+    the flat list [doc, score, doc, score, ...] ordered by score.
+    """
+    postings: dict[str, list[tuple[int, int]]] = {}
+    for doc_id, terms in enumerate(doc_terms):
+        for term, score in terms.items():
+            postings.setdefault(term, []).append((doc_id, score))
+    shards: dict[str, dict[str, list[int]]] = {}
+    for term, term_postings in postings.items():
+        term_postings.sort(key=lambda x: (-x[1], x[0]))
+        flat = [v for posting in term_postings for v in posting]
+        shards.setdefault(shard_of(term), {})[term] = flat
+    manifest = {"version": SEARCH_VERSION, "docs": docs, "shards": sorted(shards)}
+    return manifest, shards
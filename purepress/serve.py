@@ -0,0 +1,331 @@
+import gzip
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Optional
+
+from flask import Flask
+from werkzeug.datastructures import Headers
+from werkzeug.wrappers import Request, Response
+from werkzeug.http import quote_etag, unquote_etag, is_resource_modified
+
+from . import app, config, post_index, root_folder, template_folder, preload_templates
+
+# only textual responses are cached in memory, and compressed if they are large enough
+TEXT_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/xml",
+    "application/xml",
+    "application/json",
+    "application/javascript",
+    "application/rss+xml",
+    "application/atom+xml",
+}
+MIN_COMPRESS_SIZE = 512
+
+
+def compress(data: bytes, encoding: str, *, best: bool = False) -> bytes:
+    # compress fast by default, and best for files compressed ahead of time
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def available_encodings() -> list[str]:
+    # brotli is optional, use it if it's installed
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return ["gzip"]
+    return ["br", "gzip"]
+
+
+class CachedResponse:
+    """
+    A rendered response, with validators computed once and compressed
+    variants of the body computed on first use.
+    """
+
+    __slots__ = ("status", "headers", "body", "etag", "last_modified", "encoded", "compressible")
+
+    def __init__(self, status: int, headers: Headers, body: bytes, *, last_modified: datetime):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        etag = headers.pop("ETag", None)
+        self.etag = unquote_etag(etag)[0] if etag else hashlib.sha1(body).hexdigest()
+        self.last_modified = last_modified
+        self.encoded: dict[str, bytes] = {}
+        self.compressible = len(body) >= MIN_COMPRESS_SIZE
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.encoded.values())
+
+    def body_for(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        data = self.encoded.get(encoding)
+        if data is None:
+            data = self.encoded[encoding] = compress(self.body, encoding)
+        return data
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache of rendered responses, bounded by the total size of
+    the bodies, including their compressed variants.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self._size = 0
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: tuple, entry: CachedResponse):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = entry
+            self._size += entry.size
+            self._evict()
+
+    def grow(self, key: tuple, delta: int):
+        # a compressed variant was added to a cached entry
+        with self._lock:
+            if key in self._entries:
+                self._size += delta
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _evict(self):
+        while self._size > self.max_size and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+
+
+class CachingMiddleware:
+    """
+    WSGI middleware serving GET and HEAD requests from a ResponseCache.
+
+    Each url is rendered by the app once, and then served with ETag and
+    Last-Modified validators (answering conditional requests with 304),
+    a Cache-Control policy and gzip/brotli compression, without touching
+    the app at all. Call `invalidate` when the sources change.
+
+    Last-Modified is the one the app gives the response (the modification
+    time of the sources it was rendered from), but never earlier than the
+    site-wide inputs (templates, configurations) were last modified.
+    """
+
+    def __init__(self, wsgi_app: Callable, *, max_size: int, page_max_age: int = 0, static_prefix: str = "/static/"):
+        self.wsgi_app = wsgi_app
+        self.cache = ResponseCache(max_size)
+        self.page_max_age = page_max_age
+        self.static_prefix = static_prefix
+        self.encodings = available_encodings()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self._generation = 0
+
+    def invalidate(self, last_modified: Optional[float] = None):
+        """Drop all cached responses, the site-wide inputs were last modified at last_modified."""
+        self._generation += 1
+        if last_modified:
+            self.last_modified = datetime.fromtimestamp(int(last_modified), timezone.utc)
+        else:
+            self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.cache.clear()
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        path = environ.get("PATH_INFO", "")
+        if environ.get("REQUEST_METHOD") not in ("GET", "HEAD") or path.startswith(self.static_prefix):
+            # static files are served (and validated) by the app itself
+            return self.wsgi_app(environ, start_response)
+        key = (
+            environ.get("wsgi.url_scheme", "http"),
+            environ.get("HTTP_HOST", ""),
+            environ.get("SCRIPT_NAME", ""),
+            path,
+            environ.get("QUERY_STRING", ""),
+        )
+        entry = self.cache.get(key)
+        if entry is None:
+            generation = self._generation
+            entry = self._render(environ)
+            if entry is None:  # not cacheable
+                return self.wsgi_app(environ, start_response)
+            if generation == self._generation:  # not rendered from stale sources
+                self.cache.set(key, entry)
+        return self._respond(key, entry, environ, start_response)
+
+    def _render(self, environ: dict[str, Any]) -> Optional[CachedResponse]:
+        # render the full response of a plain GET request, whatever the client asked
+        environ = dict(environ, REQUEST_METHOD="GET")
+        for name in ("HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE", "HTTP_ACCEPT_ENCODING"):
+            environ.pop(name, None)
+        res = Response.from_app(self.wsgi_app, environ)
+        try:
+            if res.status_code not in (200, 404) or res.mimetype not in TEXT_MIMETYPES:
+                return None
+            body = res.get_data()
+        finally:
+            res.close()
+        last_modified = self.last_modified
+        if res.last_modified is not None:
+            last_modified = max(last_modified, res.last_modified)
+        headers = Headers(res.headers)
+        for name in ("Content-Length", "Content-Encoding", "Last-Modified", "Date"):
+            headers.remove(name)
+        if "Cache-Control" not in headers:
+            if res.status_code == 200 and self.page_max_age > 0:
+                headers["Cache-Control"] = f"public, max-age={self.page_max_age}"
+            else:
+                headers["Cache-Control"] = "no-cache"
+        return CachedResponse(res.status_code, headers, body, last_modified=last_modified)
+
+    def _respond(
+        self, key: tuple, entry: CachedResponse, environ: dict[str, Any], start_response: Callable
+    ) -> Iterable[bytes]:
+        encoding = None
+        if entry.compressible:
+            accept = Request(environ).accept_encodings
+            encoding = next((e for e in self.encodings if accept[e]), None)
+        if encoding is not None and encoding not in entry.encoded:
+            size = entry.size
+            entry.body_for(encoding)
+            self.cache.grow(key, entry.size - size)
+
+        # each encoding of the body is a different representation, with its own etag
+        etag = entry.etag if encoding is None else f"{entry.etag}-{encoding}"
+        res = Response(entry.body_for(encoding), status=entry.status, headers=Headers(entry.headers))
+        res.headers["ETag"] = quote_etag(etag)
+        res.last_modified = entry.last_modified
+        if entry.compressible:
+            res.vary.add("Accept-Encoding")
+        if encoding is not None:
+            res.headers["Content-Encoding"] = encoding
+        if entry.status == 200 and not is_resource_modified(environ, etag, last_modified=entry.last_modified):
+            res.status_code = 304  # the body and entity headers are dropped by werkzeug
+        return res(environ, start_response)
+
+
+def latest_mtime(paths: list[Path]) -> float:
+    """The latest modification time of the files (recursively) in paths."""
+    latest = 0.0
+    for path in paths:
+        files = [path] if path.is_file() else path.rglob("*")
+        for file in files:
+            try:
+                latest = max(latest, file.stat().st_mtime)
+            except OSError:
+                continue
+    return latest
+
+
+def site_inputs() -> list[Path]:
+    # what every page is rendered with, besides its own sources
+    return [template_folder, root_folder / "purepress.toml"]
+
+
+def enable_serving(*, flask_app: Flask = app) -> CachingMiddleware:
+    """
+    Tune the app for serving: no debug, templates compiled once, post files
+    not checked on every request, and responses served from an in-memory cache.
+    """
+    flask_app.debug = False
+    # responses tell the modification time of their sources, see mark_sources_modified
+    flask_app.config["SERVING"] = True
+    flask_app.config["TEMPLATES_AUTO_RELOAD"] = False
+    flask_app.jinja_env.auto_reload = False
+    flask_app.config["SEND_FILE_MAX_AGE_DEFAULT"] = config.get("static_max_age", 3600)
+    post_index.freeze()
+    preload_templates()
+    middleware = CachingMiddleware(
+        flask_app.wsgi_app,
+        max_size=config.get("response_cache_max_size", 64 * 1024 * 1024),
+        page_max_age=config.get("page_max_age", 0),
+        static_prefix=flask_app.static_url_path + "/",
+    )
+    middleware.invalidate(latest_mtime(site_inputs()))
+    flask_app.wsgi_app = middleware  # type: ignore
+    return middleware
+
+
+def watch_sources(middleware: CachingMiddleware, watch_paths: list[Path], *, flask_app: Flask = app):
+    """
+    Watch the instance for changes, and invalidate the caches of the app
+    and the cached responses. Must be called in every worker process.
+    """
+    from .preview import FileWatcher, invalidate
+
+    def on_change(paths: set[Path]):
+        invalidate(paths, flask_app=flask_app)
+        middleware.invalidate(latest_mtime(site_inputs()))
+
+    watcher = FileWatcher(watch_paths, on_change)
+    watcher.start()
+    return watcher
+
+
+def run_server(
+    host: str,
+    port: int,
+    *,
+    workers: int,
+    threads: int,
+    watch_paths: list[Path],
+    flask_app: Flask = app,
+):
+    """
+    Serve the app with a pre-forking multi-worker server if gunicorn is
+    installed, and with a threaded single process server otherwise.
+    """
+    middleware = enable_serving(flask_app=flask_app)
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+
+    if BaseApplication is None or workers <= 1:
+        if watch_paths:
+            watch_sources(middleware, watch_paths, flask_app=flask_app)
+        flask_app.run(host=host, port=port, debug=False, use_reloader=False, threaded=threads > 1)
+        return
+
+    def post_fork(server, worker):
+        # threads do not survive fork, so every worker watches by itself
+        if watch_paths:
+            watch_sources(middleware, watch_paths, flask_app=flask_app)
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("preload_app", True)
+            self.cfg.set("post_fork", post_fork)
+
+        def load(self):
+            return flask_app
+
+    Application().run()
@@ -0,0 +1,81 @@
+import os
+import stat
+import shutil
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None  # type: ignore
+
+# ioctl request to share the data blocks of a file with another (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def clone_file(src_path: Path, dst_path: Path):
+    """
+    Copy the content of src_path to dst_path, sharing the data blocks if the
+    filesystem supports reflinks, copying in kernel otherwise.
+    """
+    with open(src_path, "rb") as fsrc, open(dst_path, "wb") as fdst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return
+            except OSError:
+                pass
+        if hasattr(os, "copy_file_range"):
+            size = os.fstat(fsrc.fileno()).st_size
+            copied = 0
+            try:
+                while copied < size:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                    if n == 0:
+                        break
+                    copied += n
+            except OSError:
+                pass
+            if copied == size:
+                return
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+
+def sync_file(
+    src_path: Path, dst_path: Path, *, link: bool = False, checksum: Optional[Callable[[Path], str]] = None
+) -> bool:
+    """
+    Make dst_path a copy of src_path, unless it already is one, judged by
+    (size, mtime), or by the checksum function if only the mtimes differ.
+    With link, dst_path is made a hard link of src_path where possible.
+    Returns whether the file was (re)placed.
+    """
+    src_st = os.stat(src_path)
+    try:
+        dst_st: Optional[os.stat_result] = os.lstat(dst_path)
+    except FileNotFoundError:
+        dst_st = None
+    if dst_st is not None and stat.S_ISREG(dst_st.st_mode) and dst_st.st_size == src_st.st_size:
+        if dst_st.st_mtime_ns == src_st.st_mtime_ns or os.path.samestat(src_st, dst_st):
+            return False
+        if checksum is not None and checksum(src_path) == checksum(dst_path):
+            shutil.copystat(src_path, dst_path)  # compare by stat only next time
+            return False
+    if dst_st is not None:
+        if stat.S_ISDIR(dst_st.st_mode):
+            shutil.rmtree(dst_path)
+        else:
+            # never write through an existing (possibly hard linked) file
+            os.unlink(dst_path)
+    if link:
+        try:
+            os.link(src_path, dst_path)
+            return True
+        except OSError:  # e.g. on another device
+            pass
+    clone_file(src_path, dst_path)
+    shutil.copystat(src_path, dst_path)
+    return True
@@ -0,0 +1,80 @@
+"""
+Table of contents of entries.
+
+Headings are collected from the markdown tree while converting (see
+`markdown_ext.HeadingAnchorProcessor`), with the same ids, anchors and toc
+structures html_toc gives when parsing the html, so the html is never
+parsed again.
+"""
+
+import re
+from typing import Any
+
+# characters replaced with "-" in the ids of headings, the same as html_toc
+_punctuations_exp = re.compile(
+    r"[\s\u0020-\u002f\u003a-\u0040\u005b-\u0060\u007b-\u007e"
+    r"\u00a0-\u00bf\u2000-\u206f\u2e00-\u2e7f\u3000-\u303f"
+    r"\uff01-\uff0f\uff1a-\uff20\uff3b-\uff40\uff5b-\uff65"
+    r"\uffe0-\uffe6\uffe8-\uffec\ufe10-\ufe1f]+"
+)
+
+
+class HeadingIds:
+    """
+    Ids of the headings of a document from their text, e.g. "Hello, world"
+    -> "Hello-world", and "Hello-world_1" for the second heading of it.
+    """
+
+    def __init__(self):
+        self._counts: dict[str, int] = {}
+
+    def make(self, text: str) -> str:
+        heading_id = _punctuations_exp.sub("-", text).strip("-")
+        count = self._counts.get(heading_id, 0)
+        self._counts[heading_id] = count + 1
+        return f"{heading_id}_{count}" if count else heading_id
+
+
+def anchor_html(heading_id: str) -> str:
+    """The anchor put at the start of a heading."""
+    return f'<a id="{heading_id}" href="#{heading_id}" class="anchor"></a>'
+
+
+def strip_anchors(html: str, headings: list[dict[str, Any]]) -> str:
+    """The html without the anchors of the headings, as if converted without a toc."""
+    for heading in headings:
+        html = html.replace(anchor_html(heading["id"]), "", 1)
+    return html
+
+
+def make_toc(headings: list[dict[str, Any]], depth: int = 0) -> list[dict[str, Any]]:
+    """
+    Nest the headings, given in document order as {level, id, text, inner_html},
+    by their levels, and cut the tree at depth (0 means no limit).
+    """
+    depth = min(max(depth, 0), 6) or 6
+    root: dict[str, Any] = {"level": 0, "children": []}
+    stack = [root]
+    for heading in headings:
+        node = dict(heading, children=[])
+        while node["level"] <= stack[-1]["level"]:
+            stack.pop()
+        stack[-1]["children"].append(node)
+        stack.append(node)
+
+    def cut(nodes: list[dict[str, Any]], current_depth: int) -> list[dict[str, Any]]:
+        if current_depth > depth:
+            return []
+        return [dict(node, children=cut(node["children"], current_depth + 1)) for node in nodes]
+
+    return cut(root["children"], 1)
+
+
+def toc_html(toc: list[dict[str, Any]]) -> str:
+    """The toc as nested lists of links to the headings."""
+    if not toc:
+        return ""
+    items = "".join(
+        f'<li><a href="#{node["id"]}">{node["inner_html"]}</a>{toc_html(node["children"])}</li>\n' for node in toc
+    )
+    return f"<ul>\n{items}</ul>"
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+# purepress reads the instance folder on import, so point it to a synthetic instance first
+instance_folder = Path(tempfile.mkdtemp(prefix="purepress-tests-")) / "instance"
+os.environ["PUREPRESS_INSTANCE"] = str(instance_folder)
+
+from purepress.bench import generate_instance
+
+generate_instance(instance_folder, 30, theme_folder=Path(__file__).parent.parent / "theme")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _remove_instance():
+    yield
+    shutil.rmtree(instance_folder.parent, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def instance() -> Path:
+    return instance_folder
+
+
+@pytest.fixture(scope="session")
+def app():
+    from purepress import app
+
+    return app
+
+
+@pytest.fixture(scope="session")
+def url_root() -> str:
+    # under a path, so that urls missing or doubling the app root are caught
+    return "http://example.com/blog"
+
+
+@pytest.fixture(scope="session")
+def build(app, url_root: str) -> Callable[..., Path]:
+    """
+    Build the instance under url_root, with the given configurations, into
+    the returned folder. The app and configurations are restored afterwards.
+    """
+    from purepress import config, post_index
+    from purepress.builder import build_site
+
+    def build(*, incremental: bool = False, jobs: int = 1, **options) -> Path:
+        app_config, purepress_config = dict(app.config), dict(config)
+        config.update(options)
+        try:
+            build_site(url_root, incremental=incremental, jobs=jobs)
+        finally:
+            app.config.clear()
+            app.config.update(app_config)
+            config.clear()
+            config.update(purepress_config)
+            post_index.freeze(False)
+        return instance_folder / "build"
+
+    return build
+
+
+@pytest.fixture(scope="module")
+def built_site(build: Callable[..., Path]) -> Path:
+    return build(taxonomy_feeds=True)
@@ -0,0 +1,89 @@
+import shutil
+from pathlib import Path
+from typing import Callable
+from collections import Counter
+
+
+def test_search_index_reuses_rendered_posts(build: Callable[..., Path], monkeypatch):
+    from purepress import markdown_ext, render_cache
+
+    convert = markdown_ext.convert
+    conversions = []
+
+    def counted_convert(text: str, **kwargs):
+        conversions.append(text)
+        return convert(text, **kwargs)
+
+    def count_conversions(**options) -> int:
+        render_cache.clear()
+        conversions.clear()
+        build(**options)
+        return len(conversions)
+
+    monkeypatch.setattr(markdown_ext, "convert", counted_convert)
+    without_search = count_conversions()
+    assert without_search
+    # the html of posts comes from the render cache, filled when their pages were rendered
+    assert count_conversions(search_index=True) == without_search
+
+
+def test_posts_converted_once_per_build(instance: Path, build: Callable[..., Path], monkeypatch):
+    from purepress import markdown_ext, render_cache
+
+    convert = markdown_ext.convert
+    conversions = Counter()
+
+    def counted_convert(text: str, **kwargs):
+        conversions[text] += 1
+        return convert(text, **kwargs)
+
+    monkeypatch.setattr(markdown_ext, "convert", counted_convert)
+    render_cache.clear()
+    # posts are shown in full on their pages, the index pages and the feeds
+    build(taxonomy_feeds=True)
+    bodies = [p.read_text(encoding="utf-8").split("---", 2)[2].strip() for p in (instance / "posts").glob("*.md")]
+    assert all(conversions[body] == 1 for body in bodies)
+    assert max(conversions.values()) == 1
+
+
+def test_broken_links_reported_by_incremental_builds(instance: Path, build: Callable[..., Path], capsys):
+    target = instance / "posts" / "2000-01-01-link-target.md"
+    source = instance / "posts" / "2000-01-02-link-source.md"
+    target.write_text("---\ntitle: Target\n---\n\nTarget.\n", encoding="utf-8")
+    source.write_text(
+        "---\ntitle: Source\n---\n\n[target](/posts/2000-01-01-link-target.md) [missing](/posts/missing.md)\n",
+        encoding="utf-8",
+    )
+
+    def broken_links() -> list[str]:
+        out = capsys.readouterr().out
+        return sorted(line.strip() for line in out.splitlines() if "link-source.md:" in line)
+
+    try:
+        build()
+        assert broken_links() == ["posts/2000-01-02-link-source.md: /posts/missing.md"]
+        # the source is not rendered again, its links are still checked
+        build(incremental=True)
+        assert broken_links() == ["posts/2000-01-02-link-source.md: /posts/missing.md"]
+        target.unlink()
+        build(incremental=True)
+        assert broken_links() == [
+            "posts/2000-01-02-link-source.md: /posts/2000-01-01-link-target.md",
+            "posts/2000-01-02-link-source.md: /posts/missing.md",
+        ]
+    finally:
+        target.unlink(missing_ok=True)
+        source.unlink()
+
+
+def test_parallel_build_same_as_serial(build: Callable[..., Path], tmp_path: Path):
+    def files(folder: Path) -> dict[str, bytes]:
+        return {p.relative_to(folder).as_posix(): p.read_bytes() for p in sorted(folder.rglob("*")) if p.is_file()}
+
+    serial = tmp_path / "serial"
+    shutil.copytree(build(taxonomy_feeds=True), serial)
+    parallel = files(build(jobs=2, taxonomy_feeds=True))
+    expected = files(serial)
+    assert parallel.keys() == expected.keys()
+    for name, data in expected.items():
+        assert parallel[name] == data, name
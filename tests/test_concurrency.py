@@ -0,0 +1,53 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+THREADS = 8
+
+
+@pytest.fixture
+def routes(app, monkeypatch) -> list[str]:
+    from purepress import config, indexed_posts, indexed_taxonomy
+
+    # convert the markdown on every request instead of reading the render cache
+    monkeypatch.setitem(config, "render_cache_enabled", False)
+    with app.test_request_context():
+        posts = indexed_posts()
+        tags = list(indexed_taxonomy("tags"))
+    return (
+        ["/", "/archive/", "/feed.xml", "/about/index.html"] + [p["url"] for p in posts] + [f"/tag/{t}/" for t in tags]
+    )
+
+
+def render(app, route: str) -> tuple[int, bytes]:
+    res = app.test_client().get(route)
+    return res.status_code, res.get_data()
+
+
+def test_concurrent_requests(app, routes: list[str]):
+    expected = {route: render(app, route) for route in routes}
+    assert all(status == 200 for status, _ in expected.values())
+    # every route several times, interleaved
+    requests = routes * 4
+    random.Random(0).shuffle(requests)
+    with ThreadPoolExecutor(THREADS) as executor:
+        results = list(executor.map(lambda route: render(app, route), requests))
+    for route, result in zip(requests, results):
+        assert result == expected[route], route
+
+
+def test_concurrent_conversions(app, instance):
+    from purepress.markdown_ext import convert
+
+    texts = [p.read_text(encoding="utf-8").split("---", 2)[2] for p in sorted((instance / "posts").glob("*.md"))]
+
+    def convert_all(texts: list[str]) -> list[dict]:
+        with app.test_request_context():
+            return [convert(text, parse_toc=True) for text in texts]
+
+    expected = convert_all(texts)
+    with ThreadPoolExecutor(THREADS) as executor:
+        results = list(executor.map(convert_all, [texts[i:] + texts[:i] for i in range(THREADS * 2)]))
+    for i, result in enumerate(results):
+        assert result == expected[i:] + expected[:i]
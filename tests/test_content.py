@@ -0,0 +1,27 @@
+from purepress.content import Entry
+
+
+def test_entry_lazy_fields():
+    calls = []
+
+    def load_content():
+        calls.append("content")
+        return {"content": "<p>text</p>", "toc": []}
+
+    entry = Entry({"title": "Title", "extra": 1}, lazy={"content": load_content, "toc": load_content})
+    # lazy fields are keys, but are not loaded by looking at the keys
+    assert "content" in entry
+    assert "toc" in entry
+    assert list(entry) == ["title", "extra", "content", "toc"]
+    assert len(entry) == 4
+    assert repr(entry) == "Entry({'title': 'Title', 'extra': 1}, lazy=['content', 'toc'])"
+    copy = entry.copy()
+    assert list(copy) == list(entry)
+    assert not calls
+
+    # reading the values loads them, once for all the fields of a loader
+    assert dict(entry) == {"title": "Title", "extra": 1, "content": "<p>text</p>", "toc": []}
+    assert calls == ["content"]
+    assert set(entry) == {"title", "extra", "content", "toc"}
+    assert len(entry) == 4
+    assert entry.content == "<p>text</p>"
@@ -0,0 +1,34 @@
+import re
+from pathlib import Path
+from urllib.parse import urlparse
+
+import pytest
+
+_self_link_exp = re.compile(r'<(?:atom:)?link href="([^"]+)" rel="self"/>')
+
+
+@pytest.mark.parametrize("pattern", ["*.xml", "category/*/*.xml", "tag/*/*.xml"])
+def test_built_feed_self_link(built_site: Path, url_root: str, pattern: str):
+    feeds = sorted(built_site.glob(pattern))
+    assert feeds
+    root = urlparse(url_root)
+    for feed in feeds:
+        m = _self_link_exp.search(feed.read_text(encoding="utf-8"))
+        assert m, feed
+        url = urlparse(m.group(1))
+        assert url.netloc == root.netloc
+        assert url.path == f"{root.path}/{feed.relative_to(built_site).as_posix()}"
+
+
+def test_feed_self_link(app):
+    from purepress import indexed_taxonomy
+
+    with app.test_request_context():
+        tag = next(iter(indexed_taxonomy("tags")))
+    client = app.test_client()
+    for path in ("/atom.xml", f"/tag/{tag}/feed.xml", f"/tag/{tag}/atom.xml"):
+        res = client.get(path)
+        assert res.status_code == 200
+        m = _self_link_exp.search(res.get_data(as_text=True))
+        assert m
+        assert m.group(1) == f"http://localhost{path}"
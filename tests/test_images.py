@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("PIL")
+
+
+@pytest.fixture
+def image(instance):
+    from PIL import Image
+
+    path = instance / "static" / "images" / "test-image.png"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (640, 480), (200, 100, 50)).save(path)
+    yield path
+    path.unlink()
+
+
+def test_derivative_in_new_process(app, image, monkeypatch):
+    from purepress import images, image_derivatives_folder
+
+    info = images.image_info(image)
+    name = images.derivative_name(info, 320, "webp")
+    (image_derivatives_folder / name).unlink(missing_ok=True)
+    # as in a process that has not rendered any page using the image
+    monkeypatch.setattr(images, "_sources", {})
+    monkeypatch.setattr(images, "_last_scans", {})
+
+    client = app.test_client()
+    res = client.get(f"/static/_images/{name}")
+    assert res.status_code == 200
+    assert res.mimetype == "image/webp"
+    # served from the derivatives folder from now on
+    monkeypatch.setattr(images, "_sources", {})
+    assert client.get(f"/static/_images/{name}").get_data() == res.get_data()
+    assert client.get("/static/_images/0123456789abcdef-320.webp").status_code == 404
+    assert client.get("/static/_images/not-a-derivative.webp").status_code == 404
@@ -0,0 +1,59 @@
+import os
+import sys
+import subprocess
+
+# heavy dependencies only imported with the app, see purepress/__init__.py
+LAZY_MODULES = ("flask", "markdown", "pygments")
+
+
+def run_python(code: str, instance) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PUREPRESS_INSTANCE=str(instance))
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+
+
+def imported_modules(importtime: str) -> set[str]:
+    # lines look like "import time:       123 |        456 |   package.module"
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in importtime.splitlines()
+        if line.startswith("import time:") and line.count("|") == 2
+    }
+
+
+def test_lazy_import(instance):
+    modules = imported_modules(run_python("import purepress", instance).stderr)
+    assert "purepress" in modules
+    for name in LAZY_MODULES:
+        assert name not in modules
+
+
+def test_lazy_app(instance):
+    res = run_python("import purepress; print(type(purepress.app).__name__)", instance)
+    assert res.stdout.strip() == "Flask"
+    assert "flask" in imported_modules(res.stderr)
+
+
+def test_lookups_not_constructing_app(instance):
+    code = (
+        "import inspect, purepress\n"
+        "assert not hasattr(purepress, '__all__') and not hasattr(purepress, '__wrapped__')\n"
+        "inspect.unwrap(purepress)\n"
+        "try:\n"
+        "    purepress.missing\n"
+        "except AttributeError as e:\n"
+        "    print(e)\n"
+    )
+    res = run_python(code, instance)
+    assert res.stdout.strip() == "module 'purepress' has no attribute 'missing'"
+    assert "flask" not in imported_modules(res.stderr)
+
+
+def test_application_names():
+    import purepress
+    from purepress import application
+
+    assert purepress._application_names == set(application.__all__)
+    for name in application.__all__:
+        assert getattr(purepress, name) is getattr(application, name)
@@ -0,0 +1,33 @@
+import pytest
+
+
+def test_raw_html_headings(app):
+    from purepress.toc import make_toc
+    from purepress.markdown_ext import convert
+
+    text = '# Top\n\n<h2 class="raw">Raw <em>AT&amp;T</em></h2>\n\n<div>\n<h3>Nested</h3>\n</div>\n\n## Top\n'
+    with app.test_request_context():
+        res = convert(text, parse_toc=True)
+    assert '<h2 class="raw"><a id="Raw-AT-amp-T" href="#Raw-AT-amp-T" class="anchor"></a>Raw <em>' in res["content"]
+    assert '<h3><a id="Nested" href="#Nested" class="anchor"></a>Nested</h3>' in res["content"]
+    toc = make_toc(res["headings"])
+    assert [node["id"] for node in toc] == ["Top"]
+    assert [node["id"] for node in toc[0]["children"]] == ["Raw-AT-amp-T", "Top_1"]
+    assert toc[0]["children"][0]["text"] == "Raw AT&amp;T"
+    assert toc[0]["children"][0]["inner_html"] == "Raw <em>AT&amp;T</em>"
+    assert [node["id"] for node in toc[0]["children"][0]["children"]] == ["Nested"]
+
+
+def test_server_highlighting_opt_in(app, monkeypatch):
+    from purepress import config
+    from purepress.markdown_ext import convert
+
+    text = "```python\nprint(1)\n```\n"
+    pytest.importorskip("pygments")
+    with app.test_request_context():
+        # highlighted in the browser by default
+        assert 'class="language-python"' in convert(text)["content"]
+        monkeypatch.setitem(config, "highlight_code", True)
+        assert (
+            '<div class="highlight"><pre><span></span><code><span class="nb">print</span>' in convert(text)["content"]
+        )
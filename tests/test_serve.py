@@ -0,0 +1,43 @@
+import os
+
+from werkzeug.test import Client
+from werkzeug.http import http_date
+
+
+def test_last_modified_of_sources(app, instance, monkeypatch):
+    from purepress import config, indexed_posts
+    from purepress.serve import CachingMiddleware
+
+    monkeypatch.setitem(app.config, "SERVING", True)
+    middleware = CachingMiddleware(app.wsgi_app, max_size=1024 * 1024)
+    # the site-wide inputs are older than all sources
+    middleware.invalidate(86400)
+    client = Client(middleware)
+
+    with app.test_request_context():
+        first_page = indexed_posts()[: config["posts_per_index_page"]]
+    posts = first_page[:2]
+    mtimes = [1_600_000_000, 1_700_000_000]
+    for post, mtime in zip(posts, mtimes):
+        os.utime(instance / "posts" / post["filename"], (mtime, mtime))
+    about = instance / "pages" / "about" / "index.md"
+    os.utime(about, (1_500_000_000, 1_500_000_000))
+
+    def last_modified(path: str) -> float:
+        res = client.get(path)
+        assert res.status_code == 200
+        return res.last_modified.timestamp()
+
+    for post, mtime in zip(posts, mtimes):
+        assert last_modified(post["url"]) == mtime
+    assert last_modified("/about/index.html") == 1_500_000_000
+    # listing pages are as new as the newest post listed
+    assert last_modified("/") == max(int((instance / "posts" / p["filename"]).stat().st_mtime) for p in first_page)
+
+    # but never older than the site-wide inputs
+    middleware.invalidate(1_650_000_000)
+    assert last_modified(posts[0]["url"]) == 1_650_000_000
+    assert last_modified(posts[1]["url"]) == 1_700_000_000
+
+    res = client.get(posts[1]["url"], headers={"If-Modified-Since": http_date(1_700_000_000)})
+    assert res.status_code == 304
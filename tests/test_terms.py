@@ -0,0 +1,25 @@
+import json
+
+
+def test_terms_json_falls_through_to_raw_files(app, instance, monkeypatch):
+    from purepress import config
+
+    raw_file = instance / "raw" / "tags.json"
+    raw_file.parent.mkdir(exist_ok=True)
+    raw_file.write_text('{"raw": true}', encoding="utf-8")
+    client = app.test_client()
+    try:
+        monkeypatch.setitem(config, "taxonomy_terms", False)
+        res = client.get("/tags.json")
+        assert res.status_code == 200
+        assert json.loads(res.get_data()) == {"raw": True}
+        assert client.get("/categories.json").status_code == 404
+
+        monkeypatch.setitem(config, "taxonomy_terms", True)
+        res = client.get("/tags.json")
+        assert res.status_code == 200
+        terms = json.loads(res.get_data())
+        assert terms
+        assert all("name" in term and "url" in term for term in terms)
+    finally:
+        raw_file.unlink()
@@ -0,0 +1,69 @@
+// Client of the search index built by purepress (`search_index = true` in config).
+//
+//   const results = await purepressSearch("/search/", "关键词 query");
+//
+// Resolves to the matched documents ({ url, title, date }), best first.
+// The tokenization must be the same as purepress/search.py.
+(function () {
+  const CJK = "\\u3040-\\u30ff\\u3400-\\u4dbf\\u4e00-\\u9fff\\uf900-\\ufaff\\uac00-\\ud7af";
+  const cjkExp = new RegExp(`[${CJK}]`, "u");
+  const tokenExp = new RegExp(`[${CJK}]+|(?:(?![${CJK}])[\\p{L}\\p{N}])+`, "gu");
+
+  function tokenize(text) {
+    const tokens = [];
+    for (const [token] of text.toLowerCase().matchAll(tokenExp)) {
+      const chars = Array.from(token);
+      if (cjkExp.test(token)) {
+        if (chars.length === 1) tokens.push(token);
+        for (let i = 0; i + 1 < chars.length; i++) tokens.push(chars[i] + chars[i + 1]);
+      } else if (chars.length > 1 || /^\p{N}$/u.test(token)) {
+        tokens.push(token);
+      }
+    }
+    return tokens;
+  }
+
+  function shardOf(term) {
+    const code = term.codePointAt(0);
+    return code < 128 ? term[0] : "u" + (code >> 8).toString(16);
+  }
+
+  const cache = {};
+
+  function load(root, name) {
+    const url = root + name + ".json";
+    if (!cache[url]) {
+      cache[url] = fetch(url).then((res) => (res.ok ? res.json() : {}));
+    }
+    return cache[url];
+  }
+
+  async function search(root, query) {
+    const index = await load(root, "index");
+    const terms = [...new Set(tokenize(query))];
+    if (!terms.length) return [];
+    const shards = new Set(index.shards);
+    const scores = new Map();
+    for (const [i, term] of terms.entries()) {
+      const name = shardOf(term);
+      const shard = shards.has(name) ? await load(root, name) : {};
+      // the last term may be incomplete while typing, match it as a prefix
+      const keys = i === terms.length - 1 ? Object.keys(shard).filter((k) => k.startsWith(term)) : [term];
+      const termScores = new Map();
+      for (const key of keys) {
+        const postings = shard[key] || [];
+        for (let j = 0; j < postings.length; j += 2) {
+          termScores.set(postings[j], (termScores.get(postings[j]) || 0) + postings[j + 1]);
+        }
+      }
+      // documents must match all terms
+      for (const doc of i === 0 ? termScores.keys() : [...scores.keys()]) {
+        if (termScores.has(doc)) scores.set(doc, (scores.get(doc) || 0) + termScores.get(doc));
+        else scores.delete(doc);
+      }
+    }
+    return [...scores.entries()].sort((a, b) => b[1] - a[1] || a[0] - b[0]).map(([doc]) => index.docs[doc]);
+  }
+
+  window.purepressSearch = search;
+})();